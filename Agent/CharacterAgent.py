@@ -26,6 +26,7 @@ class CharacterAgent(BaseChatAgent):
         self.personality = personality
         self.gender = gender
         self.tmp_memory = []
+        self._memory_agent = None  # 首次读取记忆时创建，之后复用
         self.state = {
             "role": role,
             "memory": memory,
@@ -52,8 +53,9 @@ class CharacterAgent(BaseChatAgent):
         name = self.name
         # 临时记忆，决策前产生的事件，不更新知识图谱但在本轮交互中需要使用，展示情节变化
         # 读取角色状态（读取知识图谱，获得相关信息）
-        memory = MemoryAgent()
-        character_memory = memory.get_character_memory(name, chapter)  # 假设章节
+        if self._memory_agent is None:
+            self._memory_agent = MemoryAgent()
+        character_memory = self._memory_agent.get_character_memory(name, chapter)  # 假设章节
         # 生成回复内容
         prompt = messages[-1].content if messages else ""
         full_prompt = f"你现在是{self.name}，请以该角色的身份回复：{prompt},你所知道的信息是：{character_memory}。刚刚发生了{self.tmp_memory}"
@@ -1,37 +1,94 @@
+import copy
 import json
 import logging
 import os
 import shutil
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional
 from Resource.tools.kg_builder import KnowledgeGraphBuilder
-from Resource.tools.neo4j_connector import Neo4jConnector
+from Resource.tools.neo4j_connector import AsyncNeo4jConnector, Neo4jConnector
 
 # 设置日志记录
 logging.basicConfig(level=logging.INFO)  # 设置日志级别为INFO
 logger = logging.getLogger(__name__)  # 获取当前模块的日志记录器
 
+# 以下查询由同步方法与 a_ 开头的异步方法共用
+EVENT_PROPERTIES_QUERY = """
+MATCH (e:Event {id: $event_id})
+RETURN properties(e) as event_properties
+"""
+
+EVENT_DETAILS_QUERY = """
+MATCH (e:Event {id: $event_id})
+RETURN e.details as event_details
+"""
+
+# 事件的 (chapter, order) 复合范围索引：按章节区间做索引查找，LIMIT 在数据库端截断；
+# order 为 null 的事件（方案模板的默认值）同样返回，升序排序时排在同章最后；
+# order 相同时按 e.id 排序，保证每次返回相同的事件及顺序
+NEXT_CHAPTERS_EVENTS_QUERY = """
+MATCH (e:Event)
+WHERE e.chapter > $current_chapter
+      AND e.chapter <= $max_chapter
+RETURN e.id as event_id, e.name as event_name, e.details as details,
+       e.order as event_order, 'Chapter' + toString(e.chapter) AS chapter_label
+ORDER BY e.chapter, e.order, e.id
+LIMIT $limit
+"""
+
 
 class MemoryAgent:
     """
     这是一个封装了小说章节数据处理、知识图谱构建与角色记忆查询的智能代理类。
+    查询方法均提供 a_ 开头的异步版本（基于 neo4j 异步驱动），供 asyncio 工作流使用，不阻塞事件循环。
     """
 
     def __init__(self):
         self.connector = Neo4jConnector()  # 连接到 Neo4j 数据库
-        self.builder = KnowledgeGraphBuilder(self.connector)  # 初始化知识图谱构建器
+        self.async_connector = AsyncNeo4jConnector()  # 异步连接，供 a_ 开头的查询方法使用
+        self.builder = KnowledgeGraphBuilder(self.connector, self.async_connector)  # 初始化知识图谱构建器
         self.current_chapter = 0  # 初始化当前章节编号 初始为 0
+        self._memory_snapshots = {}  # 章节级角色记忆快照 {chapter: {character_id: memory}}
         print("MemoryAgent初始化完成")
         logger.info("MemoryAgent初始化完成")
 
     def clear_all_chapter_data(self):
         """
         清除所有章节的数据
-        遍历章节编号 1 到 999，调用图谱构建器清除每个章节的数据。
+        先查询知识图谱中实际存在的章节（第1章及以后），再分批删除这些章节的数据。
+        """
+        self.builder.purge_chapters(min_chapter=1)
+        self.invalidate_memory_cache()
+
+    def cleanup_duplicate_relationships(self, chapter: Optional[int] = None) -> int:
+        """
+        维护命令：清理重复的人物关系
+
+        写入时已按 (类型, 章节, 起点, 终点) 合并关系，正常流程不需要调用；
+        chapter 为 None 时扫描整个数据库，否则只处理指定章节。
+        """
+        deleted = self.builder.cleanup_duplicate_relationships(chapter)
+        if deleted:
+            self.invalidate_memory_cache()
+        return deleted
+
+    def run_maintenance(self, merge_duplicate_nodes: bool = True, dedupe_relationships: bool = True,
+                        chapter: Optional[int] = None) -> Dict:
+        """
+        维护命令：合并重复节点、清理重复关系，并确保图谱结构为最新版本
+
+        该操作会扫描整个图谱，只应手动执行，参数含义见 KnowledgeGraphBuilder.run_maintenance
+        """
+        report = self.builder.run_maintenance(merge_duplicate_nodes, dedupe_relationships, chapter)
+        self.invalidate_memory_cache()
+        return report
+
+    def invalidate_memory_cache(self):
+        """
+        清空角色记忆快照
+        知识图谱写入新数据后调用，保证后续读取到的是最新记忆。
         """
-        # 默认最大章节号为 999，可根据实际需求调整范围。
-        for chapter in range(1, 1000):
-            self.builder.clear_chapter_data(chapter)
+        self._memory_snapshots.clear()
 
     def load_initial_data(self, json_file: str):
         """
@@ -49,6 +106,7 @@ class MemoryAgent:
                 raise FileNotFoundError(f"初始数据JSON文件不存在: {json_file}")
 
             else: self.builder.load_initial_data(json_file)
+            self.invalidate_memory_cache()
 
             # 日志输出加载结果
             logger.info(
@@ -83,6 +141,8 @@ class MemoryAgent:
             # 这里的json_path是章节文件路径
             # 处理章节数据（更新Neo4j）
             self.builder.process_chapter(json_path)
+            # 人物属性和关系已更新，之前的记忆快照失效
+            self.invalidate_memory_cache()
 
             # 如果图谱构建成功，记录日志并返回 True
             logger.info(f"成功构建第 {self.current_chapter} 章知识图谱")
@@ -92,6 +152,50 @@ class MemoryAgent:
             logger.error(f"加载章节失败: {str(e)}")
             return False
 
+    def resume_chapters(self, initial_file: str, chapter_files: Dict[int, str]) -> List[int]:
+        """
+        断点续跑：使知识图谱与已保存的章节文件保持一致
+
+        以章节完成标记为检查点，找到第一个未完整写入的章节 m（第0章为初始数据），
+        清理 m 及之后（包括超出已保存文件范围）的章节数据，再按顺序重新导入缺失的章节；
+        m 之前的章节只恢复构建器的人物缓存，不重复写入。
+
+        参数:
+            initial_file (str): 初始数据（第0章）JSON文件路径
+            chapter_files (Dict[int, str]): 章节编号到章节文件路径的映射（需从第1章起连续）
+
+        返回:
+            List[int]: 重新导入的章节编号列表
+        """
+        completed = set(self.builder.get_completed_chapters())
+        last_chapter = max(chapter_files, default=0)
+        first_missing = next((c for c in range(last_chapter + 1) if c not in completed), last_chapter + 1)
+        stale = [c for c in self.builder.get_existing_chapters() if c >= first_missing]
+
+        if stale:
+            # 清理未完成或超出已保存文件范围的章节
+            self.builder.purge_chapters(min_chapter=first_missing)
+
+        reingested = []
+        if first_missing == 0:
+            if not self.load_initial_data(initial_file):
+                raise RuntimeError("重新导入初始数据失败")
+            reingested.append(0)
+        else:
+            self.builder.restore_caches(
+                initial_file, [chapter_files[c] for c in range(1, first_missing)]
+            )
+
+        for chapter in range(max(1, first_missing), last_chapter + 1):
+            if not self.load_chapter(chapter_files[chapter]):
+                raise RuntimeError(f"重新导入第{chapter}章失败")
+            self.save_character_memories(chapter)
+            reingested.append(chapter)
+
+        self.invalidate_memory_cache()
+        logger.info(f"知识图谱已恢复到第{last_chapter}章，重新导入的章节: {reingested or '无'}")
+        return reingested
+
     def get_event(self, event_id: str) -> Dict:
         """
         获取指定事件的所有属性
@@ -104,26 +208,34 @@ class MemoryAgent:
         返回:
             Dict: 包含事件所有属性的字典，如果事件不存在则返回错误信息
         """
-        query = """
-        MATCH (e:Event {id: $event_id})
-        RETURN properties(e) as event_properties
-        """
-        params = {"event_id": event_id}
-
         try:
-            result = self.connector.execute_query(query, params)
-            if not result:
-                return {"error": f"事件ID {event_id} 不存在"}
-
-            event_properties = result[0]["event_properties"]
-            logger.info(f"成功获取事件 {event_id} 的属性")
-            return event_properties
+            result = self.connector.execute_query(EVENT_PROPERTIES_QUERY, {"event_id": event_id})
+            return self._event_properties_from_result(event_id, result)
+        except Exception as e:
+            error_msg = f"获取事件属性失败: {str(e)}"
+            logger.error(error_msg)
+            return {"error": error_msg}
 
+    async def a_get_event(self, event_id: str) -> Dict:
+        """get_event 的异步版本"""
+        try:
+            result = await self.async_connector.execute_query(EVENT_PROPERTIES_QUERY, {"event_id": event_id})
+            return self._event_properties_from_result(event_id, result)
         except Exception as e:
             error_msg = f"获取事件属性失败: {str(e)}"
             logger.error(error_msg)
             return {"error": error_msg}
-        
+
+    @staticmethod
+    def _event_properties_from_result(event_id: str, result) -> Dict:
+        """从查询结果中提取事件属性"""
+        if not result:
+            return {"error": f"事件ID {event_id} 不存在"}
+
+        event_properties = result[0]["event_properties"]
+        logger.info(f"成功获取事件 {event_id} 的属性")
+        return event_properties
+
     def get_event_details(self, event_id: str) -> Dict:
         """
         获取指定事件的details属性内容
@@ -136,36 +248,44 @@ class MemoryAgent:
         返回:
             Dict: 包含事件details属性的字典，如果事件不存在或没有details属性则返回错误信息
         """
-        query = """
-        MATCH (e:Event {id: $event_id})
-        RETURN e.details as event_details
-        """
-        params = {"event_id": event_id}
-
         try:
-            result = self.connector.execute_query(query, params)
-            if not result:
-                return {"error": f"事件ID {event_id} 不存在"}
-
-            # 检查details属性是否存在
-            event_details = result[0].get("event_details")
-            if event_details is None:
-                return {"error": f"事件ID {event_id} 没有details属性"}
-
-            logger.info(f"成功获取事件 {event_id} 的details属性")
-            return {"details": event_details}
+            result = self.connector.execute_query(EVENT_DETAILS_QUERY, {"event_id": event_id})
+            return self._event_details_from_result(event_id, result)
+        except Exception as e:
+            error_msg = f"获取事件details属性失败: {str(e)}"
+            logger.error(error_msg)
+            return {"error": error_msg}
 
+    async def a_get_event_details(self, event_id: str) -> Dict:
+        """get_event_details 的异步版本"""
+        try:
+            result = await self.async_connector.execute_query(EVENT_DETAILS_QUERY, {"event_id": event_id})
+            return self._event_details_from_result(event_id, result)
         except Exception as e:
             error_msg = f"获取事件details属性失败: {str(e)}"
             logger.error(error_msg)
             return {"error": error_msg}
 
+    @staticmethod
+    def _event_details_from_result(event_id: str, result) -> Dict:
+        """从查询结果中提取事件的details属性"""
+        if not result:
+            return {"error": f"事件ID {event_id} 不存在"}
+
+        # 检查details属性是否存在
+        event_details = result[0].get("event_details")
+        if event_details is None:
+            return {"error": f"事件ID {event_id} 没有details属性"}
+
+        logger.info(f"成功获取事件 {event_id} 的details属性")
+        return {"details": event_details}
+
     def get_character_memory(self, character_id: str, chapter: int) -> Dict:
         """
         获取指定角色在特定章节的记忆
 
-        此函数通过请求的character_id和chapter参数，调用builder的get_character_profile方法
-        来获取角色的基本记忆信息，并对其进行处理和格式化，返回一个增强格式的记忆字典
+        此函数通过请求的character_id和chapter参数，从章节记忆快照中读取角色记忆，
+        快照缺失时调用builder批量查询并格式化为增强格式的记忆字典
 
         参数:
             character_id (str): 角色ID，用于指定需要获取记忆的角色
@@ -174,125 +294,200 @@ class MemoryAgent:
         返回:
             Dict: 格式化后的角色记忆字典，如果发生错误，则直接返回错误信息
         """
-        # 调用builder的方法获取角色记忆信息
-        memory = self.builder.get_character_profile(character_id, chapter)
+        return self.get_character_memories([character_id], chapter)[character_id]
 
-        # 检查获取的记忆中是否包含错误信息，如果包含则直接返回
-        if "error" in memory:
-            return memory
+    def get_character_memories(self, character_ids: List[str], chapter: int) -> Dict[str, Dict]:
+        """
+        批量获取多个角色在特定章节的记忆
 
-        # 设定 从 知识图谱读取的记忆的输出格式 即 增强记忆格式
-        # 增强记忆格式，包括章节、角色属性、关系和事件
-        enhanced_memory = {
-            "chapter": chapter,
-            "characters": memory["properties"],
-            "relationships": memory["relationships"],
-            "events": memory["events"]
-        }
-        # 返回增强格式的记忆
-        return enhanced_memory
+        同一章节的记忆会缓存为快照，直到 load_chapter / load_initial_data 写入新数据时失效，
+        因此在一章内为多个候选方案构建角色提示词时，只会查询一次知识图谱。
 
-    def save_character_memories(self, chapter: int, base_path: str = None):
+        参数:
+            character_ids (List[str]): 角色ID列表
+            chapter (int): 章节编号
+
+        返回:
+            Dict[str, Dict]: 以角色ID为键的增强格式记忆字典，未找到的角色对应错误信息
+        """
+        missing = self._missing_memories(character_ids, chapter)
+        if missing:
+            # 一次查询取回所有缺失角色的记忆
+            profiles = self.builder.get_character_profiles(missing, chapter)
+            self._fill_snapshot(missing, profiles, chapter)
+        return self._copy_memories(character_ids, chapter)
+
+    async def a_get_character_memories(self, character_ids: List[str], chapter: int) -> Dict[str, Dict]:
+        """get_character_memories 的异步版本，与同步版本共用记忆快照"""
+        missing = self._missing_memories(character_ids, chapter)
+        if missing:
+            profiles = await self.builder.a_get_character_profiles(missing, chapter)
+            self._fill_snapshot(missing, profiles, chapter)
+        return self._copy_memories(character_ids, chapter)
+
+    async def a_get_character_memory(self, character_id: str, chapter: int) -> Dict:
+        """get_character_memory 的异步版本"""
+        return (await self.a_get_character_memories([character_id], chapter))[character_id]
+
+    def _missing_memories(self, character_ids: List[str], chapter: int) -> List[str]:
+        """返回快照中尚未缓存的角色ID（去重并保持顺序）"""
+        snapshot = self._memory_snapshots.setdefault(chapter, {})
+        return [cid for cid in dict.fromkeys(character_ids) if cid not in snapshot]
+
+    def _fill_snapshot(self, character_ids: List[str], profiles: Dict[str, Dict], chapter: int):
+        """将查询到的人物档案格式化后写入章节快照"""
+        snapshot = self._memory_snapshots.setdefault(chapter, {})
+        for character_id in character_ids:
+            memory = profiles.get(character_id)
+            if memory is None:
+                snapshot[character_id] = {"error": "Character not found"}
+                continue
+
+            # 设定 从 知识图谱读取的记忆的输出格式 即 增强记忆格式
+            # 增强记忆格式，包括章节、角色属性、关系和事件
+            snapshot[character_id] = {
+                "chapter": chapter,
+                "characters": memory["properties"],
+                "relationships": memory["relationships"],
+                "events": memory["events"]
+            }
+
+    def _copy_memories(self, character_ids: List[str], chapter: int) -> Dict[str, Dict]:
+        """返回快照副本，避免调用方修改快照内容"""
+        snapshot = self._memory_snapshots.get(chapter, {})
+        return {cid: copy.deepcopy(snapshot[cid]) for cid in character_ids}
+
+    def save_character_memories(self, chapter: int, base_path: str = None, per_character_files: bool = False):
         """
         查找输入章节下的所有角色记忆
         保存输入章节下的所有角色记忆到JSON文件
 
+        导出时取回的整章记忆同时写入记忆快照，下一章构建角色提示词时不需要再查询。
+
         参数:
             chapter (int): 章节编号
             base_path (str): 可选的自定义基础路径
+            per_character_files (bool): 是否同时为每个角色保存单独的记忆文件
         """
         try:
             # 使用知识图谱构建器的方法保存记忆
-            self.builder.save_character_memories_kg(chapter, base_path)
+            memories = self.builder.save_character_memories_kg(chapter, base_path, per_character_files)
+            snapshot = self._memory_snapshots.setdefault(chapter, {})
+            for character_id, memory in memories.items():
+                snapshot[character_id] = {
+                    "chapter": chapter,
+                    "characters": memory["properties"],
+                    "relationships": memory["relationships"],
+                    "events": memory["events"]
+                }
             logger.info(f"成功保存第{chapter}章的角色记忆")
         except Exception as e:
             logger.error(f"保存角色记忆失败: {str(e)}")
             raise
 
 
-    def get_previous_chapters_events(self, character_id: str, current_chapter: int):
+    def get_previous_chapters_events(self, character_id: str, current_chapter: int, limit: int = 2):
         """
-        从已保存的角色记忆中获取前五章的事件
-        如果当前章节<=5，则返回从第1章到当前章节前一章的所有事件
+        获取人物在前两章中参与的事件，按章节和事件顺序排列，最多返回 limit 条
         """
-        previous_events = []
+        return self.get_characters_previous_events([character_id], current_chapter, limit)[character_id]
 
-        # 限制事件数量
-        limit = 2
+    async def a_get_previous_chapters_events(self, character_id: str, current_chapter: int, limit: int = 2):
+        """get_previous_chapters_events 的异步版本"""
+        return (await self.a_get_characters_previous_events([character_id], current_chapter, limit))[character_id]
 
-        # 确定查询范围
-        start_chapter = max(1, current_chapter - 2)
-        end_chapter = current_chapter - 1
+    def get_characters_previous_events(self, character_ids: List[str], current_chapter: int,
+                                       limit: int = 2) -> Dict[str, List[Dict]]:
+        """
+        批量获取多个人物在前两章中参与的事件
 
-        # 遍历范围内的每一章
-        for chapter in range(start_chapter, end_chapter + 1):
-            try:
-                # 获取该章节的角色记忆
-                memory = self.get_character_memory(character_id, chapter)
-                if memory and "events" in memory:
-                    # 为每个事件添加章节信息
-                    for event in memory["events"]:
-                        event["chapter_num"] = chapter
-                        event["chapter_label"] = f"Chapter{chapter}"
-                    previous_events.extend(memory["events"])
-            except Exception as e:
-                logger.error(f"获取第{chapter}章记忆失败: {str(e)}")
+        只查询事件（不取人物属性与关系），所有人物、所有章节一次查询完成，
+        排序与数量限制在数据库端完成。
 
-        # 按章节和事件顺序排序
-        previous_events.sort(key=lambda x: (x["chapter_num"], x.get("event_order", 0)))
+        参数:
+            character_ids (List[str]): 人物ID列表
+            current_chapter (int): 当前章节编号
+            limit (int): 每个人物返回的最大事件数
 
-        # 如果设置了限制数量，则返回限制数量的事件
-        if limit is not None:
-            previous_events = previous_events[:limit]
+        返回:
+            Dict[str, List[Dict]]: 以人物ID为键的事件列表，查询失败时各人物对应空列表
+        """
+        start_chapter, end_chapter = self._previous_chapter_range(current_chapter)
+        try:
+            return self.builder.get_characters_events(character_ids, start_chapter, end_chapter, limit)
+        except Exception as e:
+            logger.error(f"获取前序章节事件失败: {str(e)}")
+            return {character_id: [] for character_id in character_ids}
 
-        return previous_events
+    async def a_get_characters_previous_events(self, character_ids: List[str], current_chapter: int,
+                                               limit: int = 2) -> Dict[str, List[Dict]]:
+        """get_characters_previous_events 的异步版本"""
+        start_chapter, end_chapter = self._previous_chapter_range(current_chapter)
+        try:
+            return await self.builder.a_get_characters_events(character_ids, start_chapter, end_chapter, limit)
+        except Exception as e:
+            logger.error(f"获取前序章节事件失败: {str(e)}")
+            return {character_id: [] for character_id in character_ids}
 
-    def get_next_chapters_events(self, current_chapter: int, end_chapter: int):
-        """
-        获取当前章节后最多5章中的所有事件（增强兼容性版本）
+    @staticmethod
+    def _previous_chapter_range(current_chapter: int):
+        """确定前序章节的查询范围（含两端）"""
+        return max(1, current_chapter - 2), current_chapter - 1
+
+    def get_next_chapters_events(self, current_chapter: int, end_chapter: int, limit: int = 2):
         """
-        # 限制事件数量
-        limit = 2
+        获取当前章节后最多2章中的事件，按章节和事件顺序排列，最多返回 limit 条
 
+        查询使用事件的 (chapter, order) 索引，排序与截断都在数据库端完成，
+        耗时只与返回的事件数相关，不随故事总章节数增长。
+        """
         if current_chapter >= end_chapter:
             return []
 
-        # 更健壮的查询方案
-        query = """
-        MATCH (e:Event)
-        // 提取所有Chapter开头的标签
-        WITH e, [label IN labels(e) WHERE label STARTS WITH 'Chapter'] AS chapter_labels
-        WHERE size(chapter_labels) > 0
-        // 提取纯数字部分（兼容各种Chapter标签格式）
-        WITH e, chapter_labels[0] AS chapter_label,
-             toInteger(apoc.text.replace(chapter_labels[0], '[^0-9]', '')) AS chapter_num
-        WHERE chapter_num > $current_chapter 
-              AND chapter_num <= $max_chapter
-        RETURN e.id as event_id, e.name as event_name, e.details as details,
-               e.order as event_order, chapter_label
-        ORDER BY chapter_num, e.order
-        """
-        params = {
-            "current_chapter": current_chapter,
-            "max_chapter": min(current_chapter + 2, end_chapter)
-        }
-
+        params = self._next_chapters_params(current_chapter, end_chapter, limit)
         try:
-            result = self.connector.execute_query(query, params)
+            result = self.connector.execute_query(NEXT_CHAPTERS_EVENTS_QUERY, params)
             logger.info(f"查询第{current_chapter}章后事件: 条件{params} 结果{len(result)}条")
+            return result
+        except Exception as e:
+            logger.error(f"查询后续章节事件失败: {str(e)}")
+            return []
 
-            # 如果设置了限制数量，则返回限制数量的事件
-            if limit is not None:
-                result = result[:limit]
+    async def a_get_next_chapters_events(self, current_chapter: int, end_chapter: int, limit: int = 2):
+        """get_next_chapters_events 的异步版本"""
+        if current_chapter >= end_chapter:
+            return []
 
+        params = self._next_chapters_params(current_chapter, end_chapter, limit)
+        try:
+            result = await self.async_connector.execute_query(NEXT_CHAPTERS_EVENTS_QUERY, params)
+            logger.info(f"查询第{current_chapter}章后事件: 条件{params} 结果{len(result)}条")
             return result
         except Exception as e:
             logger.error(f"查询后续章节事件失败: {str(e)}")
             return []
 
+    @staticmethod
+    def _next_chapters_params(current_chapter: int, end_chapter: int, limit: int) -> Dict:
+        """后续章节事件查询的参数"""
+        return {
+            "current_chapter": current_chapter,
+            "max_chapter": min(current_chapter + 2, end_chapter),
+            "limit": int(limit)
+        }
+
     def close(self):
         """
-        关闭与Neo4j数据库的连接
+        关闭与Neo4j数据库的同步及异步连接（在协程中请使用 a_close）
         """
         self.connector.close()  # 关闭Neo4j数据库连接
+        self.async_connector.close_sync()  # 释放异步连接
         logger.info("Neo4j连接已关闭")  # 记录连接关闭的信息到日志
+
+    async def a_close(self):
+        """
+        关闭与Neo4j数据库的同步及异步连接
+        """
+        self.connector.close()  # 关闭Neo4j数据库连接
+        await self.async_connector.close()  # 关闭异步连接
+        logger.info("Neo4j连接已关闭")
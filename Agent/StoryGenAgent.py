@@ -4,14 +4,22 @@ from Resource.template.storygen_prompt.shortgoal import SHORTGOAL_AGENT_PROMPT_T
 from Resource.template.storygen_prompt.decision import decision_prompt_template
 
 
-def create_agents(model_client):
-    shortgoal_agent = AssistantAgent(
-        name="shortgoal_agent",
+def create_shortgoal_agent(model_client, name="shortgoal_agent"):
+    """
+    创建短期目标智能体
+    并发生成多个候选短期目标时，每个候选使用独立的实例，避免共享上下文
+    """
+    return AssistantAgent(
+        name=name,
         description="生成短期目标，即当前任务的目标",
         model_client=model_client,
         system_message=SHORTGOAL_AGENT_PROMPT_TEMPLATE
     )
 
+
+def create_agents(model_client):
+    shortgoal_agent = create_shortgoal_agent(model_client)
+
     longgoal_agent = AssistantAgent(
         name="long_goal_agent",
         model_client=model_client,
@@ -1,5 +1,4 @@
 from autogen_agentchat.agents import AssistantAgent
-from Agent.MemoryAgent import MemoryAgent
 from Resource.template.write_prompt.novel_writer import novel_write_prompt_template
 from Resource.template.write_prompt.script_writer import script_write_prompt_template
 from Resource.template.write_prompt.recallagent import recall_prompt_template
@@ -9,86 +8,73 @@ from autogen_core.model_context import UnboundedChatCompletionContext
 import os
 import json
 from autogen_agentchat.messages import TextMessage
-def create_agents(model_client):
+def _format_task(task):
+    """确保任务数据格式正确"""
+    if isinstance(task, str):
+        try:
+            task = json.loads(task)
+        except json.JSONDecodeError:
+            task = {"content": task}
+    return task if isinstance(task, dict) else {"content": str(task)}
+
+
+def _attach_a_run(agent):
     """
-    创建并返回所有需要的智能体
-    :param model_client: 语言模型客户端
-    :return: 包含所有智能体的字典
+    为智能体添加 a_run 异步调用包装器，其作用是确保传入的任务始终为字符串格式
     """
-    # 实例化MemoryAgent
-    memoryAgent = MemoryAgent
+    def async_run_wrapper(task):
+        # 确保任务始终为字典格式，避免字符串直接传入
+        formatted_task = _format_task(task)
+        # 使用json.dumps将字典转为字符串，确保类型正确
+        new_task = json.dumps(formatted_task, ensure_ascii=False)
+        return agent.run(task=new_task)
 
-    # 1. 准备初始消息（可选，根据业务需求添加）
-    initial_messages = []
-    # 2. 直接实例化 UnboundedChatCompletionContext
-    context_recall = UnboundedChatCompletionContext(initial_messages=initial_messages)
-    context_digger = UnboundedChatCompletionContext(initial_messages=initial_messages)
-    context_novel = UnboundedChatCompletionContext(initial_messages=initial_messages)
-    context_script = UnboundedChatCompletionContext(initial_messages=initial_messages)
+    agent.a_run = async_run_wrapper
+    return agent
 
-    # 创建回忆Agent
-    recallAgent = AssistantAgent(
-        name="recallAgent",
+
+def create_recall_agent(model_client, name="recallAgent"):
+    """
+    创建回忆Agent
+    并发为多个人物做回忆分析时，每个人物使用独立的实例（各自的上下文），互不干扰
+    """
+    return _attach_a_run(AssistantAgent(
+        name=name,
         description="回忆Agent，负责根据当前方案与先前章节方案，判断是否需要回溯前文的相关情节和背景信息",
         model_client=model_client,
-        model_context=context_recall,
+        model_context=UnboundedChatCompletionContext(initial_messages=[]),
         system_message=recall_prompt_template,
-    )
+    ))
+
 
-    # 创建挖坑Agent
-    diggerAgent = AssistantAgent(
-        name="diggerAgent",
+def create_digger_agent(model_client, name="diggerAgent"):
+    """创建挖坑Agent"""
+    return _attach_a_run(AssistantAgent(
+        name=name,
         description="挖坑Agent，负责分析当前章节与后续章节，判断是否需要设置伏笔",
         model_client=model_client,
-        model_context=context_digger,
+        model_context=UnboundedChatCompletionContext(initial_messages=[]),
         system_message=dig_prompt_template,
-    )
+    ))
 
-    # 创建小说写作Agent
-    novel_writer = AssistantAgent(
-        name="NovelwriterAgent",
+
+def create_novel_writer(model_client, name="NovelwriterAgent"):
+    """创建小说写作Agent"""
+    return _attach_a_run(AssistantAgent(
+        name=name,
         description="小说写作Agent，负责将最终的方案进行写作，生成小说",
-        model_context= context_novel, # 更改模型的上下文类型，支持清空
+        model_context=UnboundedChatCompletionContext(initial_messages=[]),  # 更改模型的上下文类型，支持清空
         model_client=model_client,
         system_message=novel_write_prompt_template,
-    )
+    ))
+
 
-    # 创建剧本写作Agent
-    script_writer = AssistantAgent(
-        name="ScriptwriterAgent",
+def create_script_writer(model_client, name="ScriptwriterAgent"):
+    """创建剧本写作Agent"""
+    return _attach_a_run(AssistantAgent(
+        name=name,
         description="电影剧本写作Agent，负责将最终的方案进行写作，生成电影剧本",
-        model_context= context_script, # 更改模型的上下文类型，支持清空
+        model_context=UnboundedChatCompletionContext(initial_messages=[]),  # 更改模型的上下文类型，支持清空
         model_client=model_client,
         system_message=script_write_prompt_template,
-    )
-
-    def format_task(task): #
-        """确保任务数据格式正确"""
-        if isinstance(task, str):
-            try:
-                task = json.loads(task)
-            except json.JSONDecodeError:
-                task = {"content": task}
-        return task if isinstance(task, dict) else {"content": str(task)}
-
-    # 修改异步调用包装器，其作用是确保传入的任务始终为字符串格式
-    def async_run_wrapper(agent, task):
-        # 确保任务始终为字典格式，避免字符串直接传入
-        formatted_task = format_task(task)
-        # 使用json.dumps将字典转为字符串，确保类型正确
-        new_task = json.dumps(formatted_task,ensure_ascii=False)
-        return agent.run(task=new_task)  # 新增此行转换
-
-    recallAgent.a_run = lambda task: async_run_wrapper(recallAgent, task)
-    diggerAgent.a_run = lambda task: async_run_wrapper(diggerAgent, task)
-    novel_writer.a_run = lambda task: async_run_wrapper(novel_writer, task)
-    script_writer.a_run = lambda task: async_run_wrapper(script_writer, task)
-    # 返回所有需要的Agent
-    return {
-        "memAgent": memoryAgent,
-        "recallAgent": recallAgent,
-        "diggerAgent": diggerAgent,
-        "novel_writer": novel_writer,
-        "script_writer": script_writer
-        # 移除了recall_search和digger_search，因为它们的功能与recallAgent/diggerAgent重复
-    }
+    ))
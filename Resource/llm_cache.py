@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelInfo, RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 默认缓存文件位置：项目根/Resource/cache/llm_cache.sqlite3
+DEFAULT_CACHE_PATH = Path(__file__).parent / "cache" / "llm_cache.sqlite3"
+
+
+class SQLiteResponseStore:
+    """
+    基于 SQLite 的 LLM 响应存储，支持 TTL 过期与 LRU 淘汰。
+
+    每条记录保存创建时间和最近访问时间：
+    - 超过 ttl 秒的记录在读取时视为未命中并删除；
+    - 记录数超过 max_entries 时，按最近访问时间淘汰最旧的记录。
+    """
+
+    def __init__(self, path: Union[str, Path] = DEFAULT_CACHE_PATH, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        """
+        :param path: SQLite 文件路径
+        :param ttl: 记录有效期（秒），None 表示永不过期
+        :param max_entries: 最大记录数，None 表示不限制
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期或不存在时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str):
+        """写入缓存，并在超出容量时按 LRU 淘汰"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    """
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (int(self.max_entries),)
+                )
+            self._conn.commit()
+
+    def clear(self):
+        """清空所有缓存记录"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        """关闭 SQLite 连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class CachedChatCompletionClient(ChatCompletionClient):
+    """
+    带响应缓存的模型客户端包装器。
+
+    缓存键由模型名、采样参数以及完整的请求内容（系统提示词、消息、工具、json_output、extra_create_args）计算得到。
+    同一进程内完全相同的请求会再附加一个出现序号：例如同一提示词生成三个候选短期目标时，
+    三次请求分别对应三条缓存记录，重跑时依次命中，而不会退化成三个相同的候选。
+
+    bypass=True 时不读取缓存（仍会写入最新结果），可用于强制刷新。
+    """
+
+    def __init__(self, client: ChatCompletionClient, model_name: str, store: SQLiteResponseStore,
+                 sampling_params: Optional[Dict[str, Any]] = None, bypass: bool = False):
+        """
+        :param client: 被包装的真实模型客户端
+        :param model_name: 模型名称，参与缓存键计算
+        :param store: 响应存储
+        :param sampling_params: 客户端创建时配置的采样参数，参与缓存键计算
+        :param bypass: 是否跳过缓存读取
+        """
+        self._client = client
+        self.model_name = model_name
+        self.store = store
+        self.sampling_params = dict(sampling_params or {})
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._occurrences = Counter()
+
+    @staticmethod
+    def _to_jsonable(value: Any) -> Any:
+        """将消息、工具等对象转换为可序列化的结构"""
+        if hasattr(value, "model_dump"):
+            return value.model_dump(mode="json")
+        if hasattr(value, "schema"):
+            return value.schema
+        if isinstance(value, type):
+            return value.__name__
+        return value
+
+    def _cache_key(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], tool_choice: Any,
+                   json_output: Any, extra_create_args: Mapping[str, Any]) -> str:
+        """计算请求的缓存键（附带同一请求在本进程内的出现序号）"""
+        payload = json.dumps(
+            {
+                "model": self.model_name,
+                "sampling_params": self.sampling_params,
+                "messages": [self._to_jsonable(m) for m in messages],
+                "tools": [self._to_jsonable(t) for t in tools],
+                "tool_choice": tool_choice if isinstance(tool_choice, str) else self._to_jsonable(tool_choice),
+                "json_output": self._to_jsonable(json_output),
+                "extra_create_args": dict(extra_create_args),
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        occurrence = self._occurrences[digest]
+        self._occurrences[digest] += 1
+        return f"{digest}:{occurrence}"
+
+    def _lookup(self, key: str) -> Optional[CreateResult]:
+        """读取缓存并更新命中统计"""
+        if not self.bypass:
+            cached = self.store.get(key)
+            if cached is not None:
+                try:
+                    result = CreateResult.model_validate_json(cached)
+                    result.cached = True
+                    self.hits += 1
+                    return result
+                except ValueError as e:
+                    logger.warning(f"LLM 缓存记录损坏，已忽略: {e}")
+        self.misses += 1
+        return None
+
+    def _save(self, key: str, result: CreateResult):
+        """写入缓存，失败时只记录日志"""
+        try:
+            self.store.set(key, result.model_dump_json())
+        except Exception as e:
+            logger.warning(f"写入 LLM 缓存失败: {e}")
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | str = "auto",
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = self._cache_key(messages, tools, tool_choice, json_output, extra_create_args)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        result = await self._client.create(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self._save(key, result)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | str = "auto",
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        key = self._cache_key(messages, tools, tool_choice, json_output, extra_create_args)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield cached
+            return
+
+        async for chunk in self._client.create_stream(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            if isinstance(chunk, CreateResult):
+                self._save(key, chunk)
+            yield chunk
+
+    def stats(self) -> Dict[str, int]:
+        """返回缓存命中统计"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self):
+        return self._client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+def create_response_store_from_env() -> SQLiteResponseStore:
+    """
+    根据环境变量创建响应存储：
+    - LLM_CACHE_PATH: SQLite 文件路径
+    - LLM_CACHE_TTL: 记录有效期（秒）
+    - LLM_CACHE_MAX_ENTRIES: 最大记录数
+    """
+    ttl = os.getenv("LLM_CACHE_TTL")
+    max_entries = os.getenv("LLM_CACHE_MAX_ENTRIES")
+    return SQLiteResponseStore(
+        path=os.getenv("LLM_CACHE_PATH", str(DEFAULT_CACHE_PATH)),
+        ttl=float(ttl) if ttl else None,
+        max_entries=int(max_entries) if max_entries else None
+    )
@@ -1,225 +1,169 @@
 import os
+import threading
 from dotenv import load_dotenv
 from autogen_ext.models.openai import OpenAIChatCompletionClient
+from Resource.llm_cache import CachedChatCompletionClient, create_response_store_from_env
 # from autogen_core.models import UserMessage
 # import asyncio
 
+# 服务商配置：接口地址及 API Key 所在的环境变量名
+PROVIDERS = {
+    "siliconflow": {
+        "base_url": "https://api.siliconflow.cn/v1",
+        "api_key_env": "SILICONFLOW_API_KEY",  # 修改你的 API Key 环境变量名
+    },
+    "openrouter": {
+        "base_url": "https://openrouter.ai/api/v1",
+        "api_key_env": "OPENROUTER_API_KEY",  # openrouter api key
+    },
+}
+
+# 所有模型共用的能力声明
+DEFAULT_MODEL_INFO = {
+    "tool_choice_supported": True,
+    "tool_choice_required": False,
+    "structured_output": True,
+    "vision": False,
+    "function_calling": True,
+    "json_output": True
+}
+
+# 模型定义表：名称 -> 服务商、模型ID 以及与默认能力声明不同的 model_info 字段
+MODEL_CONFIGS = {
+    "deepseek-v3": {
+        "provider": "siliconflow",
+        "model": "deepseek-ai/DeepSeek-V3",
+        "model_info": {"family": "deepseek", "context_length": 8192, "max_output_tokens": 2048},
+    },
+    "pro-deepseek-v3": {
+        "provider": "siliconflow",
+        "model": "Pro/deepseek-ai/DeepSeek-V3",
+        "model_info": {"family": "deepseek", "context_length": 128000, "max_output_tokens": 8192},
+    },
+    "deepseek-r1": {
+        "provider": "siliconflow",
+        "model": "deepseek-ai/DeepSeek-R1",
+        "model_info": {"family": "r1", "context_length": 8192, "max_output_tokens": 2048},
+    },
+    "qwen3": {
+        "provider": "siliconflow",
+        "model": "Qwen/Qwen3-30B-A3B",
+        "model_info": {"family": "qwen3", "context_length": 8192, "max_output_tokens": 2048},
+    },
+    "glm4.5-air": {
+        "provider": "siliconflow",
+        "model": "zai-org/GLM-4.5-Air",
+        "model_info": {"family": "glm", "context_length": 120000, "max_output_tokens": 8192},
+    },
+    "gpt4o": {
+        "provider": "openrouter",
+        "model": "openai/chatgpt-4o-latest",
+        "model_info": {"family": "4o", "context_length": 8192, "max_output_tokens": 2048},
+    },
+    "gpt-4.1-mini": {
+        "provider": "openrouter",
+        "model": "openai/gpt-4.1-mini",
+        "model_info": {"family": "gpt-41", "context_length": 128000, "max_output_tokens": 8192},
+    },
+    "gpt4o-mini": {
+        "provider": "openrouter",
+        "model": "openai/gpt-4o-mini",
+        "model_info": {"family": "4o", "context_length": 8192, "max_output_tokens": 2048},
+    },
+    "llama4-maverick": {
+        "provider": "openrouter",
+        "model": "meta-llama/llama-4-maverick",
+        "model_info": {"family": "llama4", "context_length": 8192, "max_output_tokens": 2048},
+    },
+    "llama4-scout": {
+        "provider": "openrouter",
+        "model": "meta-llama/llama-4-scout",
+        "model_info": {"family": "llama", "context_length": 8192, "max_output_tokens": 2048},
+    },
+    "gemini-2.5-flash": {
+        "provider": "openrouter",
+        "model": "google/gemini-2.5-flash",
+        "model_info": {"family": "gemini-2.5-flash", "context_length": 120000, "max_output_tokens": 8192},
+    },
+    "grok-3-mini": {
+        "provider": "openrouter",
+        "model": "x-ai/grok-3-mini",
+        "model_info": {"family": "gork", "context_length": 120000, "max_output_tokens": 8192},
+    },
+}
+
+# 进程级客户端注册表：同一模型在整个进程中只创建一次客户端（及其 HTTP 连接池）
+_client_registry = {}
+_cached_client_registry = {}
+_cache_store = None
+_registry_lock = threading.Lock()
+
+
+def _build_client(model_name: str) -> OpenAIChatCompletionClient:
+    """根据模型定义表创建模型客户端"""
+    config = MODEL_CONFIGS[model_name]
+    provider = PROVIDERS[config["provider"]]
+    return OpenAIChatCompletionClient(
+        model=config["model"],
+        base_url=provider["base_url"],
+        api_key=os.getenv(provider["api_key_env"]),
+        model_info={**DEFAULT_MODEL_INFO, **config["model_info"]},
+    )
+
+
 class LLMClientManager:
     """
     LLMClientManager 封装了多种 LLM 客户端的初始化与获取方法。
     可通过 get_client(model_name) 获取指定模型的客户端实例。
+    get_client(model_name, use_cache=True) 返回带本地响应缓存的客户端（见 Resource/llm_cache.py）。
+
+    模型定义见 MODEL_CONFIGS。客户端在第一次 get_client 时才创建，并保存在进程级注册表中，
+    多个 LLMClientManager 实例共享同一批客户端。
     """
 
     def __init__(self):
         load_dotenv()
-        siliconflow_api_key = os.getenv("SILICONFLOW_API_KEY") # 修改你的 API Key 环境变量名
-        openrouter_api_key = os.getenv("OPENROUTER_API_KEY") # openrouter api key
-
-        # 初始化各类模型客户端
-        self.clients = {
-            "deepseek-v3": OpenAIChatCompletionClient(
-                model="deepseek-ai/DeepSeek-V3",
-                base_url="https://api.siliconflow.cn/v1",
-                api_key=siliconflow_api_key,
-                model_info={
-                    "family": "deepseek",
-                    "context_length": 8192,
-                    "max_output_tokens": 2048,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "pro-deepseek-v3": OpenAIChatCompletionClient(
-                model="Pro/deepseek-ai/DeepSeek-V3",
-                base_url="https://api.siliconflow.cn/v1",
-                api_key=siliconflow_api_key,
-                model_info={
-                    "family": "deepseek",
-                    "context_length": 128000,
-                    "max_output_tokens": 8192,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "deepseek-r1": OpenAIChatCompletionClient(
-                model="deepseek-ai/DeepSeek-R1",
-                base_url="https://api.siliconflow.cn/v1",
-                api_key=siliconflow_api_key,
-                model_info={
-                    "family": "r1",
-                    "context_length": 8192,
-                    "max_output_tokens": 2048,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "qwen3": OpenAIChatCompletionClient(
-                model="Qwen/Qwen3-30B-A3B",
-                base_url="https://api.siliconflow.cn/v1",
-                api_key=siliconflow_api_key,
-                model_info={
-                    "family": "qwen3",
-                    "context_length": 8192,
-                    "max_output_tokens": 2048,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "glm4.5-air": OpenAIChatCompletionClient(
-                model="zai-org/GLM-4.5-Air",
-                base_url="https://api.siliconflow.cn/v1",
-                api_key=siliconflow_api_key,
-                model_info={
-                    "family": "glm",
-                    "context_length": 120000,
-                    "max_output_tokens": 8192,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "gpt4o": OpenAIChatCompletionClient(
-                model="openai/chatgpt-4o-latest",
-                base_url="https://openrouter.ai/api/v1",
-                api_key=openrouter_api_key,
-                model_info={
-                    "family": "4o",
-                    "context_length": 8192,
-                    "max_output_tokens": 2048,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "gpt-4.1-mini": OpenAIChatCompletionClient(
-                model="openai/gpt-4.1-mini",
-                base_url="https://openrouter.ai/api/v1",
-                api_key=openrouter_api_key,
-                model_info={
-                    "family": "gpt-41",
-                    "context_length": 128000,
-                    "max_output_tokens": 8192,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "gpt4o-mini": OpenAIChatCompletionClient(
-                model="openai/gpt-4o-mini",
-                base_url="https://openrouter.ai/api/v1",
-                api_key=openrouter_api_key,
-                model_info={
-                    "family": "4o",
-                    "context_length": 8192,
-                    "max_output_tokens": 2048,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "llama4-maverick": OpenAIChatCompletionClient(
-                model="meta-llama/llama-4-maverick",
-                base_url="https://openrouter.ai/api/v1",
-                api_key=openrouter_api_key,
-                model_info={
-                    "family": "llama4",
-                    "context_length": 8192,
-                    "max_output_tokens": 2048,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "llama4-scout": OpenAIChatCompletionClient(
-                model="meta-llama/llama-4-scout",
-                base_url="https://openrouter.ai/api/v1",
-                api_key=openrouter_api_key,
-                model_info={
-                    "family": "llama",
-                    "context_length": 8192,
-                    "max_output_tokens": 2048,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "gemini-2.5-flash": OpenAIChatCompletionClient(
-                model="google/gemini-2.5-flash",
-                base_url="https://openrouter.ai/api/v1",
-                api_key=openrouter_api_key,
-                model_info={
-                    "family": "gemini-2.5-flash",
-                    "context_length": 120000,
-                    "max_output_tokens": 8192,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            ),
-            "grok-3-mini": OpenAIChatCompletionClient(
-                model="x-ai/grok-3-mini",
-                base_url="https://openrouter.ai/api/v1",
-                api_key=openrouter_api_key,
-                model_info={
-                    "family": "gork",
-                    "context_length": 120000,
-                    "max_output_tokens": 8192,
-                    "tool_choice_supported": True,
-                    "tool_choice_required": False,
-                    "structured_output": True,
-                    "vision": False,
-                    "function_calling": True,
-                    "json_output": True
-                },
-            )
-        }
-
-    def get_client(self, model_name: str):
+
+    def get_client(self, model_name: str, use_cache: bool = False):
         """
         根据模型名称获取对应的 LLM 客户端实例。
-        支持 'deepseek-v3'、'deepseek-r1','qwen3'、'glm4'。
+        支持的名称见 MODEL_CONFIGS，如 'deepseek-v3'、'deepseek-r1'、'qwen3'、'glm4.5-air'。
+
+        use_cache 为 True 时返回带响应缓存的包装客户端，缓存位置与容量由环境变量
+        LLM_CACHE_PATH / LLM_CACHE_TTL / LLM_CACHE_MAX_ENTRIES 配置，
+        LLM_CACHE_BYPASS=1 时跳过缓存读取。
         """
-        client = self.clients.get(model_name.lower())
-        if not client:
+        global _cache_store
+
+        model_name = model_name.lower()
+        if model_name not in MODEL_CONFIGS:
             raise ValueError(f"不支持的模型名称: {model_name}")
-        return client
+
+        with _registry_lock:
+            client = _client_registry.get(model_name)
+            if client is None:
+                client = _build_client(model_name)
+                _client_registry[model_name] = client
+            if not use_cache:
+                return client
+
+            cached_client = _cached_client_registry.get(model_name)
+            if cached_client is None:
+                if _cache_store is None:
+                    _cache_store = create_response_store_from_env()
+                config = MODEL_CONFIGS[model_name]
+                cached_client = CachedChatCompletionClient(
+                    client,
+                    model_name=model_name,
+                    store=_cache_store,
+                    sampling_params={
+                        "model": config["model"],
+                        "base_url": PROVIDERS[config["provider"]]["base_url"]
+                    },
+                    bypass=os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+                )
+                _cached_client_registry[model_name] = cached_client
+            return cached_client
 
 # 测试代码
 # async def main():
@@ -232,4 +176,4 @@ class LLMClientManager:
 #     await client.close()
 
 # if __name__ == "__main__":
-#     asyncio.run(main())
\ No newline at end of file
+#     asyncio.run(main())
@@ -0,0 +1,33 @@
+class CompiledPrompt:
+    """
+    预编译提示词模板。
+
+    提示词分为两部分：
+    - 静态前缀：角色说明、生成要求、输出模板、示例等不随调用变化的内容，在创建时渲染一次；
+    - 动态部分：每次调用时只替换其中的字段。
+
+    静态前缀始终位于提示词开头，不同角色、不同候选方案、不同章节的请求共享同一前缀，
+    服务商的前缀缓存（prompt caching）可以直接命中。static_prefix / prefix_length 暴露了前缀边界。
+    """
+
+    def __init__(self, static_template: str, dynamic_template: str, **static_fields):
+        """
+        :param static_template: 静态部分模板
+        :param dynamic_template: 动态部分模板
+        :param static_fields: 静态部分的填充字段，只在创建时使用一次
+        """
+        self.static_prefix = static_template.format(**static_fields) if static_fields else static_template
+        self.dynamic_template = dynamic_template
+
+    @property
+    def prefix_length(self) -> int:
+        """静态前缀的字符长度，即前缀边界在完整提示词中的位置"""
+        return len(self.static_prefix)
+
+    def render_parts(self, **dynamic_fields):
+        """返回 (静态前缀, 动态部分) 两段文本"""
+        return self.static_prefix, self.dynamic_template.format(**dynamic_fields)
+
+    def render(self, **dynamic_fields) -> str:
+        """渲染完整提示词：静态前缀 + 动态部分"""
+        return self.static_prefix + self.dynamic_template.format(**dynamic_fields)
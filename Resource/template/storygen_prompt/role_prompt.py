@@ -1,13 +1,11 @@
-ROLE_PROMPT_TEMPLATE = """
-        你是小说角色，请基于以下信息生成下一章节的剧情方案。
+import json
 
-        [角色背景]
-        - 身份: {role_identity}
-        - 关系网: {role_relation}
-        - 上一章事件: {role_events}
+from Resource.template.compiled_prompt import CompiledPrompt
+from Resource.template.story_template import story_plan_template, story_plan_example
 
-        [当前章节目标]
-        {short_goal}
+# 静态部分：所有角色、所有章节共用，放在提示词开头以便命中服务商的前缀缓存
+ROLE_PROMPT_STATIC = """
+        你是小说角色，请基于提示词末尾的角色背景和当前章节目标生成下一章节的剧情方案。
 
         [生成要求]
         1. 生成当前角色的剧情方案（基于角色背景（包括身份、关系网、上一章事件）和当前章节目标）。
@@ -19,14 +17,33 @@ ROLE_PROMPT_TEMPLATE = """
         [输出格式(JSON)]
         - 模板结构：
         {template_str}
-              
+
         - 示例参考(仅学习其格式，不学习具体内容):
         {example_str}
-        
+
 
         [规则]
         - 只需生成以下三个部分：1. relationships: 角色关系变化; 2. scenes: 新场景(2-3个); 3. events: 事件序列(5-10个)
         - 不要生成未列出的字段
         - 不要添加 Markdown 或 ```json
         - 确保 JSON 语法正确，类型与示例一致
-        """
\ No newline at end of file
+"""
+
+# 动态部分：每个角色、每个候选方案单独填充
+ROLE_PROMPT_DYNAMIC = """
+        [角色背景]
+        - 身份: {role_identity}
+        - 关系网: {role_relation}
+        - 上一章事件: {role_events}
+
+        [当前章节目标]
+        {short_goal}
+        """
+
+# 模板结构与示例在导入时只序列化一次
+ROLE_PROMPT = CompiledPrompt(
+    ROLE_PROMPT_STATIC,
+    ROLE_PROMPT_DYNAMIC,
+    template_str=json.dumps(story_plan_template, ensure_ascii=False, indent=2),
+    example_str=json.dumps(story_plan_example, ensure_ascii=False, indent=2)
+)
@@ -7,6 +7,35 @@ import json
 import asyncio
 
 
+# 评分 Agent 池：{id(model_client): (model_client, [空闲的评分 Agent])}
+# 同一模型客户端的评分 Agent 在多次评分之间复用，并发评分时每个任务各占用一个实例
+_score_agent_pool = {}
+
+
+def _acquire_score_agent(model_client):
+    """
+    从评分 Agent 池中取出一个空闲的评分 Agent，池为空时新建
+    """
+    _, idle_agents = _score_agent_pool.setdefault(id(model_client), (model_client, []))
+    if idle_agents:
+        return idle_agents.pop()
+
+    return AssistantAgent(
+        name="scoreAgent",
+        description="根据评分模板对提取逻辑原子，对每个逻辑原子进行评分",
+        model_client = model_client,
+        system_message=decision_prompt_template
+    )
+
+
+async def _release_score_agent(model_client, agent):
+    """
+    清空评分 Agent 的上下文并放回池中
+    """
+    await agent.model_context.clear()
+    _score_agent_pool[id(model_client)][1].append(agent)
+
+
 async def score_plan(plan, model_client):
     """
     对单个plan进行评分
@@ -36,14 +65,9 @@ async def score_plan(plan, model_client):
         "p10": 0.05 # 计划连贯性吸引力
     }
 
-    # 定义评分 Agent 用以对方案进行评分
+    # 从评分 Agent 池中取出一个评分 Agent，用以对方案进行评分
     # TODO: 评分规则待完善
-    scoreAgent = AssistantAgent(
-        name="scoreAgent",
-        description="根据评分模板对提取逻辑原子，对每个逻辑原子进行评分",
-        model_client = model_client,
-        system_message=decision_prompt_template
-    )
+    scoreAgent = _acquire_score_agent(model_client)
 
     # Agent 分析得到的10个逻辑原子的值
     # prompt 要修改
@@ -51,7 +75,8 @@ async def score_plan(plan, model_client):
     score_output = await scoreAgent.run(
         task=TextMessage(content=f"请按模板对下面方案评分：\n\n{plan}",source="user")
     )
-    await scoreAgent.model_context.clear()
+    # 清空上下文后放回池中复用；调用失败的 Agent 直接丢弃
+    await _release_score_agent(model_client, scoreAgent)
 
     print("逻辑原子评分结果：")
     print(score_output)
@@ -69,26 +94,50 @@ async def score_plan(plan, model_client):
     return weighted_score
 
     
-async def evaluate_plan(plans,model_client):
+async def evaluate_plan(plans, model_client, max_concurrency=None, score_threshold=None):
     """
     对一组计划进行评分，并选出评分最高的计划。
 
+    所有方案并发评分；如果设置了 score_threshold，则任一方案达到阈值后立即取消其余评分并返回该方案。
+
     :param plans: 计划列表，每个计划是一个字典。
     :param model_client: 模型客户端实例，用于评分。
+    :param max_concurrency: 同时评分的最大方案数，None 表示不限制。
+    :param score_threshold: 提前结束的评分阈值，None 表示评完所有方案。
     :return: 最佳计划及其评分 (best_plan, best_score)。
     """
+    semaphore = asyncio.Semaphore(max_concurrency or max(1, len(plans)))
+
+    async def _score(index, plan):
+        async with semaphore:
+            # 计算每个故事方案的评分，同时带回方案在输入中的序号，用于评分相同时的排序
+            return index, plan, await score_plan(plan, model_client)
 
+    tasks = [asyncio.create_task(_score(index, plan)) for index, plan in enumerate(plans)]
     plan_scores = []
-    for plan in plans:
-        # 计算每个故事方案的评分
-        score = await score_plan(plan, model_client)
-        
-        # 将故事方案及其评分添加到列表中
-        plan_scores.append((plan, score))
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                index, plan, score = await finished
+            except Exception as e:
+                print(f"⚠️ 方案评分失败: {str(e)}")
+                continue
+
+            # 将故事方案及其评分添加到列表中
+            plan_scores.append((index, plan, score))
+
+            # 达到阈值则提前结束，不再等待其余方案的评分
+            if score_threshold is not None and score >= score_threshold:
+                print(f"✅ 方案评分 {score} 达到阈值 {score_threshold}，提前结束评估")
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
 
     # 选出评分最高的故事方案
     if plan_scores:  # 确保列表不为空
-        best_plan, best_score = max(plan_scores, key=lambda x: x[1])  # 按评分排序，取最高的，返回方案和评分，其中方案是最佳方案
+        # 按评分取最高的；评分相同时取输入顺序靠前的方案，结果与评分完成顺序无关
+        _, best_plan, best_score = max(plan_scores, key=lambda x: (x[2], -x[0]))
 
     else:
         best_plan, best_score = None, 0
@@ -1,30 +1,135 @@
+import asyncio
 import json
 import os
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 from neo4j import GraphDatabase
 from typing import Dict, List, Optional, Any
 import logging
-from Resource.tools.neo4j_connector import Neo4jConnector
+from Resource.tools.neo4j_connector import AsyncNeo4jConnector, Neo4jConnector
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 批量查询人物档案：人物通过 APPEARS_IN 关联章节，事件/场景通过 chapter 属性（范围索引）过滤。
+# 本章人物关系只会在两端人物都出现在本章时写入，因此只需按 r.chapter 过滤。
+_CHARACTER_PROFILE_BODY = """
+CALL {
+    WITH p
+    OPTIONAL MATCH (p)-[r]->(other:Character)
+    WHERE r.chapter = $chapter
+    RETURN collect(CASE WHEN r IS NULL THEN NULL ELSE {
+        character_id: other.id,
+        name: other.name,
+        type: TYPE(r),
+        intensity: r.intensity,
+        awareness: r.awareness,
+        new_detail: r.new_detail,
+        chapter: r.chapter
+    } END) AS relationships
+}
+CALL {
+    WITH p
+    OPTIONAL MATCH (p)-[:IN_EVENT]->(e:Event)-[:OCCURRED_IN]->(s:Scene)
+    WHERE e.chapter = $chapter AND s.chapter = $chapter
+    WITH e, s
+    ORDER BY e.order, e.id
+    RETURN collect(CASE WHEN e IS NULL THEN NULL ELSE {
+        event_id: e.id,
+        event_name: e.name,
+        event_order: e.order,
+        details: e.details,
+        scene_id: s.id,
+        scene_name: s.name,
+        scene_place: s.place,
+        emotional_impact: e.emotional_impact,
+        consequences: e.consequences
+    } END) AS events
+}
+RETURN p.id AS character_id, p {.*} AS properties, relationships, events
+"""
+
+CHARACTER_PROFILES_QUERY = """
+UNWIND $character_ids AS character_id
+MATCH (p:Character {id: character_id})-[:APPEARS_IN]->(:Chapter {number: $chapter})
+""" + _CHARACTER_PROFILE_BODY
+
+# 整章所有人物的档案（导出记忆时使用）
+CHAPTER_PROFILES_QUERY = """
+MATCH (:Chapter {number: $chapter})<-[:APPEARS_IN]-(p:Character)
+""" + _CHARACTER_PROFILE_BODY
+
+# 批量查询多个人物在章节区间内参与的事件：只取事件，不取人物属性与关系；
+# 每个人物的排序与数量限制在子查询中完成；order 相同时按 e.id 排序，保证 LIMIT 截取的事件稳定
+CHARACTERS_EVENTS_QUERY = """
+UNWIND $character_ids AS character_id
+MATCH (p:Character {id: character_id})
+CALL {
+    WITH p
+    MATCH (p)-[:IN_EVENT]->(e:Event)-[:OCCURRED_IN]->(s:Scene)
+    WHERE e.chapter >= $start_chapter AND e.chapter <= $end_chapter
+      AND s.chapter = e.chapter
+      AND EXISTS { (p)-[:APPEARS_IN]->(:Chapter {number: e.chapter}) }
+    WITH e, s
+    ORDER BY e.chapter, e.order, e.id
+    LIMIT $limit
+    RETURN collect({
+        event_id: e.id,
+        event_name: e.name,
+        event_order: e.order,
+        details: e.details,
+        scene_id: s.id,
+        scene_name: s.name,
+        scene_place: s.place,
+        emotional_impact: e.emotional_impact,
+        consequences: e.consequences,
+        chapter_num: e.chapter,
+        chapter_label: 'Chapter' + toString(e.chapter)
+    }) AS events
+}
+RETURN p.id AS character_id, events
+"""
+
 class KnowledgeGraphBuilder:
     """
     知识图谱构建器类，用于处理章节数据并构建知识图谱。
     该类负责从JSON文件加载章节数据，创建和更新人物、场景和事件节点，
     以及处理人物之间的关系。
+
+    章节归属的存储方式：
+    - Scene / Event 节点：chapter 属性（带范围索引）
+    - Character 节点：(p:Character)-[:APPEARS_IN]->(:Chapter {number}) 关系，Chapter 节点同时作为章节登记表
+    - 人物关系：r.chapter 属性
+    因此所有查询都是固定文本的参数化查询，可复用执行计划并走索引查找。
+    旧版本使用动态标签（如 Character:Chapter3）存储章节，可用 migrate_chapter_labels 迁移。
+
+    数据库中的 (:SchemaMeta {name: 'kg_builder'}) 节点记录图谱结构版本。构造时只读取该版本号，
+    版本落后时才执行一次 migrate_schema；重复节点合并等全库扫描的维护操作需通过 run_maintenance 手动执行。
     该类包含的方法：
-    - __init__: 初始化函数，设置Neo4j连接器，并在初始化时执行数据清理和约束设置。
+    - __init__: 初始化函数，设置Neo4j连接器，并在进程内首次初始化时检查图谱结构版本。
+    - ensure_schema: 检查图谱结构版本，版本落后时执行迁移。
+    - migrate_schema: 一次性迁移：清理重复节点、创建约束与索引、迁移旧版章节标签并写入版本号。
+    - run_maintenance: 手动执行的维护命令（合并重复节点、清理重复关系）。
     - clear_all_data: 清空Neo4j数据库中的所有数据。
     - load_initial_data: 从JSON文件加载初始数据，包括人物和关系信息。
     - process_chapter: 处理指定章节的JSON数据，更新缓存和Neo4j数据库。
     - create_scene: 创建或更新场景节点。
     - create_event: 创建事件节点并关联场景。
+    - ingest_chapter_graph: 批量写入章节的场景、事件及其关联关系。
     - get_character_profile: 查询人物完整档案。
+    - get_character_profiles: 一次查询批量获取多个人物的完整档案。
+    - a_get_character_profiles: get_character_profiles 的异步版本。
+    - get_characters_events: 一次查询获取多个人物在章节区间内的事件（含排序与数量限制）。
+    - a_get_characters_events: get_characters_events 的异步版本。
     - clear_chapter_data: 清理指定章节的所有数据。
+    - get_existing_chapters: 获取数据库中实际存在的章节编号。
+    - get_completed_chapters: 获取已完整写入（带完成标记）的章节编号。
+    - restore_caches: 从已保存的章节文件恢复人物缓存（不写入数据库），用于断点续跑。
+    - purge_chapters: 批量清理所有已存在章节的数据。
+    - cleanup_duplicate_relationships: 清理重复的人物关系（可限定章节的维护命令）。
+    - migrate_chapter_labels: 将旧版 Chapter{n} 动态标签迁移为章节属性/关系。
     - _update_characters: 批量更新人物节点。
     - _update_relationships: 批量更新人物关系。
     - _prepare_properties: 准备节点/关系的属性字典，合并默认值和提供的值。
@@ -34,18 +139,102 @@ class KnowledgeGraphBuilder:
     该类依赖于Neo4jConnector类来执行实际的数据库操作。
     """
 
-    def __init__(self, connector: Neo4jConnector):
+    # 当前图谱结构版本，结构或索引变化时递增
+    SCHEMA_VERSION = 1
+
+    # 本进程内已完成版本检查的数据库 URI
+    _initialized_uris = set()
+    _init_lock = threading.Lock()
+
+    def __init__(self, connector: Neo4jConnector, async_connector: Optional[AsyncNeo4jConnector] = None):
         """
-        初始化函数，设置Neo4j连接器，并在初始化时执行数据清理和约束设置。
+        初始化函数，设置Neo4j连接器，并检查图谱结构版本。
+        同一进程内每个数据库只检查一次；版本已是最新时只需一次读取版本号的查询。
 
         :param connector: Neo4j数据库连接器实例，用于执行数据库操作。
+        :param async_connector: 可选的异步连接器实例，供 a_ 开头的异步查询方法使用；
+                                未提供时，异步方法在线程中使用同步连接器执行查询。
          """
         self.connector = connector
-        self._clean_duplicate_data()  # 先清理重复数据
-        self._setup_constraints()  # 再创建约束
+        self.async_connector = async_connector
+        with KnowledgeGraphBuilder._init_lock:
+            uri = getattr(connector, "uri", None)
+            if uri not in KnowledgeGraphBuilder._initialized_uris:
+                self.ensure_schema()
+                KnowledgeGraphBuilder._initialized_uris.add(uri)
         self._character_cache = {} # 缓存人物数据
         self._relationship_cache = {} # 缓存人物关系数据
 
+    def get_schema_version(self) -> int:
+        """
+        读取数据库中记录的图谱结构版本
+
+        返回:
+        - int: 版本号，没有版本记录时返回 0
+        """
+        result = self.connector.execute_query("""
+        MATCH (m:SchemaMeta {name: 'kg_builder'})
+        RETURN m.version AS version
+        """)
+        if not result or result[0]["version"] is None:
+            return 0
+        return int(result[0]["version"])
+
+    def ensure_schema(self):
+        """
+        检查图谱结构版本，版本落后时执行 migrate_schema
+
+        正常情况下只执行一次读取版本号的查询。
+        """
+        version = self.get_schema_version()
+        if version >= self.SCHEMA_VERSION:
+            logger.debug("图谱结构版本 %s 已是最新", version)
+            return
+        logger.info(f"图谱结构版本 {version} 落后于 {self.SCHEMA_VERSION}，开始迁移")
+        self.migrate_schema()
+
+    def migrate_schema(self):
+        """
+        一次性迁移：清理重复节点、创建约束与索引、迁移旧版章节标签，最后写入版本号
+
+        重复节点必须在创建唯一约束之前合并，因此这里也会执行一次 _clean_duplicate_data。
+        各步骤均可重复执行。
+        """
+        self._clean_duplicate_data()  # 先清理重复数据
+        self._setup_constraints()  # 再创建约束
+        self.migrate_chapter_labels()  # 迁移旧版章节标签
+        self.connector.execute_query("""
+        MERGE (m:SchemaMeta {name: 'kg_builder'})
+        SET m.version = $version, m.migrated_at = datetime()
+        """, {"version": self.SCHEMA_VERSION})
+        logger.info(f"✅ 图谱结构已迁移到版本 {self.SCHEMA_VERSION}")
+
+    def run_maintenance(self, merge_duplicate_nodes: bool = True, dedupe_relationships: bool = True,
+                        chapter: Optional[int] = None) -> Dict:
+        """
+        手动执行的维护命令
+
+        正常写入流程不会产生重复数据，本方法用于修复旧数据或外部写入造成的问题，不会在构造时自动执行。
+
+        参数:
+        - merge_duplicate_nodes (bool): 是否按 id 合并重复的人物、场景和事件节点（全库扫描）
+        - dedupe_relationships (bool): 是否清理重复的人物关系
+        - chapter (int): 只清理指定章节的重复关系；为 None 时扫描全部关系
+
+        返回:
+        - dict: 各维护步骤的执行结果
+        """
+        report = {"merged_nodes": False, "deleted_relationships": 0}
+        if merge_duplicate_nodes:
+            self._clean_duplicate_data()
+            report["merged_nodes"] = True
+        if dedupe_relationships:
+            report["deleted_relationships"] = self.cleanup_duplicate_relationships(chapter)
+        # 确保约束、索引和版本号是最新的
+        self.ensure_schema()
+        logger.info(f"✅ 维护完成: {report}")
+        return report
+
     def clear_all_data(self):
         """
         清空Neo4j数据库中的所有数据
@@ -151,13 +340,19 @@ class KnowledgeGraphBuilder:
         """创建必要的约束
 
         此函数负责在数据库中设置必要的唯一性约束，以确保Character、Scene和Event标签的id属性的唯一性
+        以及Chapter节点编号的唯一性，并为事件、场景的chapter属性创建范围索引
         这对于维护数据的一致性和完整性至关重要
         """
 
         constraints = [
             "CREATE CONSTRAINT IF NOT EXISTS FOR (p:Character) REQUIRE p.id IS UNIQUE",
             "CREATE CONSTRAINT IF NOT EXISTS FOR (s:Scene) REQUIRE s.id IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (e:Event) REQUIRE e.id IS UNIQUE"
+            "CREATE CONSTRAINT IF NOT EXISTS FOR (e:Event) REQUIRE e.id IS UNIQUE",
+            "CREATE CONSTRAINT IF NOT EXISTS FOR (c:Chapter) REQUIRE c.number IS UNIQUE",
+            # 复合范围索引：既支持按章节查找事件，也支持按 (chapter, order) 有序读取并提前截断
+            "DROP INDEX event_chapter IF EXISTS",
+            "CREATE INDEX event_chapter_order IF NOT EXISTS FOR (e:Event) ON (e.chapter, e.order)",
+            "CREATE INDEX scene_chapter IF NOT EXISTS FOR (s:Scene) ON (s.chapter)"
         ]
 
         # 遍历约束列表，尝试执行每个约束的创建
@@ -190,23 +385,193 @@ class KnowledgeGraphBuilder:
         无
         """
         # 定义一系列Cypher查询以删除指定章节的所有相关数据
+        # 人物节点只删除不再出现在任何章节中的，其他章节的人物只解除与本章的关联
         queries = [
-            f"MATCH (n:Character:Chapter{chapter}) DETACH DELETE n",
-            f"MATCH (n:Scene:Chapter{chapter}) DETACH DELETE n",
-            f"MATCH (n:Event:Chapter{chapter}) DETACH DELETE n",
-            f"MATCH ()-[r]-() WHERE r.chapter = {chapter} DELETE r"
+            "MATCH (n:Scene) WHERE n.chapter = $chapter DETACH DELETE n",
+            "MATCH (n:Event) WHERE n.chapter = $chapter DETACH DELETE n",
+            "MATCH ()-[r]-() WHERE r.chapter = $chapter DELETE r",
+            "MATCH (c:Chapter {number: $chapter}) DETACH DELETE c",
+            "MATCH (p:Character) WHERE NOT (p)-[:APPEARS_IN]->(:Chapter) DETACH DELETE p"
         ]
         # 遍历每个查询，尝试执行删除操作
         for query in queries:
             try:
                 # 使用connector执行Cypher查询
-                self.connector.execute_query(query)
+                self.connector.execute_query(query, {"chapter": chapter})
                 # 记录调试信息，表明查询执行成功
                 logger.debug("成功执行清理查询: %s", query)
             except Exception as e:
                 # 如果执行查询时发生错误，记录错误信息
                 logger.error(f"执行清理查询时出错: {query} - {e}")
 
+    def get_existing_chapters(self) -> List[int]:
+        """
+        获取数据库中实际存在的章节编号
+
+        章节写入时会登记 (:Chapter {number}) 节点，这里直接读取登记表，不需要扫描人物、场景和事件。
+
+        返回:
+        - list: 升序排列的章节编号列表
+        """
+        query = """
+        MATCH (c:Chapter)
+        RETURN c.number AS chapter
+        """
+        try:
+            result = self.connector.execute_query(query) or []
+            return sorted({r["chapter"] for r in result if r["chapter"] is not None})
+        except Exception as e:
+            logger.error(f"获取已有章节失败: {e}")
+            return []
+
+    def get_completed_chapters(self) -> List[int]:
+        """
+        获取已完整写入知识图谱的章节编号
+
+        load_initial_data / process_chapter 全部写入完成后才会在 Chapter 节点上设置 completed 标记，
+        中途失败的章节不会出现在结果中。
+
+        返回:
+        - list: 升序排列的章节编号列表
+        """
+        query = """
+        MATCH (c:Chapter)
+        WHERE c.completed = true
+        RETURN c.number AS chapter
+        """
+        try:
+            result = self.connector.execute_query(query) or []
+            return sorted(r["chapter"] for r in result if r["chapter"] is not None)
+        except Exception as e:
+            logger.error(f"获取已完成章节失败: {e}")
+            return []
+
+    def _mark_chapter_completed(self, chapter: int):
+        """在章节节点上设置完成标记（章节检查点）"""
+        self.connector.execute_query("""
+        MERGE (c:Chapter {number: $chapter})
+        SET c.completed = true, c.completed_at = datetime()
+        """, {"chapter": chapter})
+
+    def purge_chapters(self, min_chapter: int = 1, batch_size: int = 1000) -> List[int]:
+        """
+        批量清理所有已存在章节（编号 >= min_chapter）的数据
+
+        与逐章调用 clear_chapter_data 不同，本方法先查询实际存在的章节，
+        再用 CALL { } IN TRANSACTIONS 分批删除对应的节点与关系，
+        因此耗时只与数据量相关，而与章节上限无关。
+
+        参数:
+        - min_chapter (int): 需要清理的最小章节编号，默认从第1章开始（保留第0章初始数据）
+        - batch_size (int): 每个事务删除的行数
+
+        返回:
+        - list: 被清理的章节编号列表
+        """
+        chapters = [c for c in self.get_existing_chapters() if c >= min_chapter]
+        if not chapters:
+            logger.info("没有需要清理的章节数据")
+            return []
+
+        batch_size = int(batch_size)
+        params = {"chapters": chapters}
+        # CALL { } IN TRANSACTIONS 只能在自动提交事务中运行，session.run 满足该条件
+        # 场景和事件通过 chapter 索引定位；人物在解除章节关联后，只删除不再出现在任何章节中的
+        queries = [
+            f"""
+            MATCH (n:Event)
+            WHERE n.chapter IN $chapters
+            CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {batch_size} ROWS
+            """,
+            f"""
+            MATCH (n:Scene)
+            WHERE n.chapter IN $chapters
+            CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {batch_size} ROWS
+            """,
+            f"""
+            MATCH ()-[r]->()
+            WHERE r.chapter IN $chapters
+            CALL {{ WITH r DELETE r }} IN TRANSACTIONS OF {batch_size} ROWS
+            """,
+            """
+            MATCH (c:Chapter)
+            WHERE c.number IN $chapters
+            DETACH DELETE c
+            """,
+            f"""
+            MATCH (p:Character)
+            WHERE NOT (p)-[:APPEARS_IN]->(:Chapter)
+            CALL {{ WITH p DETACH DELETE p }} IN TRANSACTIONS OF {batch_size} ROWS
+            """
+        ]
+        for query in queries:
+            try:
+                self.connector.execute_query(query, params)
+                logger.debug("成功执行批量清理查询: %s", query)
+            except Exception as e:
+                logger.error(f"执行批量清理查询时出错: {query} - {e}")
+
+        logger.info(f"已清理 {len(chapters)} 个章节的数据: {chapters}")
+        return chapters
+
+    def migrate_chapter_labels(self, batch_size: int = 1000) -> List[int]:
+        """
+        将旧版动态标签（Character:Chapter3 等）存储的章节归属迁移为当前的存储方式
+
+        - Scene / Event：写入 chapter 属性
+        - Character：建立 (p)-[:APPEARS_IN]->(:Chapter {number}) 关系
+        迁移完成后移除对应的 Chapter{n} 标签。本方法可重复执行，没有旧标签时只读取一次标签列表。
+
+        参数:
+        - batch_size (int): 每个事务处理的节点数
+
+        返回:
+        - list: 完成迁移的章节编号列表
+        """
+        try:
+            result = self.connector.execute_query("""
+            CALL db.labels() YIELD label
+            WHERE label =~ 'Chapter[0-9]+'
+            RETURN label
+            """) or []
+        except Exception as e:
+            logger.error(f"读取旧版章节标签失败: {e}")
+            return []
+
+        batch_size = int(batch_size)
+        migrated = []
+        for record in result:
+            label = record["label"]
+            chapter = int(label[len("Chapter"):])
+            # 标签无法参数化，这里的标签名来自 db.labels() 且已通过正则校验
+            queries = [
+                "MERGE (:Chapter {number: $chapter})",
+                f"""
+                MATCH (n:`{label}`)
+                WHERE n:Event OR n:Scene
+                CALL {{ WITH n SET n.chapter = $chapter REMOVE n:`{label}` }} IN TRANSACTIONS OF {batch_size} ROWS
+                """,
+                f"""
+                MATCH (p:Character:`{label}`)
+                CALL {{
+                    WITH p
+                    MATCH (ch:Chapter {{number: $chapter}})
+                    MERGE (p)-[:APPEARS_IN]->(ch)
+                    REMOVE p:`{label}`
+                }} IN TRANSACTIONS OF {batch_size} ROWS
+                """
+            ]
+            try:
+                for query in queries:
+                    self.connector.execute_query(query, {"chapter": chapter})
+                migrated.append(chapter)
+            except Exception as e:
+                logger.error(f"迁移章节标签 {label} 失败: {e}")
+
+        if migrated:
+            logger.info(f"✅ 已将 {len(migrated)} 个章节的旧版标签迁移为章节属性: {sorted(migrated)}")
+        return sorted(migrated)
+
     def load_initial_data(self, json_file: str):
         """
         加载初始数据
@@ -235,6 +600,8 @@ class KnowledgeGraphBuilder:
         # 写入Neo4j 人物和 关系
         self._update_characters(chapter)
         self._update_relationships(chapter)
+        # 以上写入全部成功后才标记完成，失败时异常向上抛出，章节保持未完成
+        self._mark_chapter_completed(chapter)
         # 日志输出加载数据的结果
         logger.info(f"✅ 已加载初始数据至知识图谱，共 {len(self._character_cache)} 个人物和 {len(self._relationship_cache)} 条关系")
 
@@ -243,10 +610,10 @@ class KnowledgeGraphBuilder:
         """
         批量更新人物节点
 
-        此函数负责将缓存中的人物数据批量更新到图数据库中，为每个角色添加章节特定的标签
+        此函数负责将缓存中的人物数据批量更新到图数据库中，并将每个角色关联到当前章节的 Chapter 节点
 
         参数:
-        chapter (int): 当前章节编号，用于添加章节特定的标签
+        chapter (int): 当前章节编号
 
         返回:
         无
@@ -255,14 +622,15 @@ class KnowledgeGraphBuilder:
         if not self._character_cache:
             return
 
-        # Cypher查询语句，用于批量更新人物节点及其属性，并添加章节标签
+        # Cypher查询语句，用于批量更新人物节点及其属性，并关联到章节节点
         query = """
+        MERGE (ch:Chapter {number: $chapter})
+        WITH ch
         UNWIND $characters AS character
         MERGE (p:Character {id: character.id})
         SET p += character.props
-        WITH p
-        CALL apoc.create.addLabels(p, ['Chapter' + $chapter]) YIELD node
-        RETURN count(node) as count
+        MERGE (p)-[:APPEARS_IN]->(ch)
+        RETURN count(p) as count
         """
 
         # 准备人物数据，将每个角色的属性和ID整理成查询所需的格式
@@ -284,100 +652,56 @@ class KnowledgeGraphBuilder:
 
     # 更新关系节点
     def _update_relationships(self, chapter: int):
-        """关系更新：复制前一章节关系到当前章节，然后用本章关系覆盖"""
-
-        # 1. 如果是第0章，直接使用初始关系
-        if chapter == 0:
-            rels_to_update = list(self._relationship_cache.values())
-        else:
-            try:
-                # 2. 查询上一章节所有关系
-                # query = f"""
-                #     MATCH (a:Character:Chapter{chapter - 1})-[r]->(b:Character:Chapter{chapter - 1})
-                #     RETURN a.id as from_id, b.id as to_id, type(r) as type, properties(r) as props
-                #     """
-                query = f""" 
-                    MATCH (a:Character:Chapter{chapter - 1})-[r]->(b:Character:Chapter{chapter - 1})
-                    WHERE r.chapter = {chapter - 1}
-                    RETURN a.id as from_id, b.id as to_id, type(r) as type, properties(r) as props
-                    """
-                inherited_rels = self.connector.execute_query(query) or []
-                logger.info(f"从章节 {chapter - 1} 继承 {len(inherited_rels)} 条关系")
-
-                # 3. 构建要更新的关系列表
-                rels_to_update = []
-
-                # 先添加所有继承的关系（复制到当前章节）
-                for rel in inherited_rels:
-                    rel_data = {
-                        'from_id': rel['from_id'],
-                        'to_id': rel['to_id'],
-                        'type': rel['type'],
-                        **rel['props']
-                    }
-                    # 确保关系标记为当前章节
-                    rel_data['chapter'] = chapter
-                    rels_to_update.append(rel_data)
-
-                print("rels_to_update:", rels_to_update)
-
-
-                # 用本章关系覆盖继承的关系
-                # print(self._relationship_cache.values())
-                for new_rel in self._relationship_cache.values():
-                    # 确保新关系有正确的章节标记
-                    new_rel['chapter'] = chapter
-                    # print("new_rel:",new_rel)
-
-                    # 查找是否已存在相同 from_id/to_id 的关系（无论类型）
-                    found = False
-                    # print("rels_to_update:",rels_to_update)
-                    for i, existing_rel in enumerate(rels_to_update):
-                        # print(i)
-                        # print(existing_rel)
-                        if (existing_rel['from_id'] == new_rel['from_id'] and
-                                existing_rel['to_id'] == new_rel['to_id']):
-                            # 覆盖现有关系（替换相同方向的关系）
-                            rels_to_update[i] = new_rel
-                            print("rels_to_update:",rels_to_update)
-                            found = True
-                            logger.info(
-                                f"替换关系: {new_rel['from_id']}->{new_rel['to_id']} ({existing_rel['type']} -> {new_rel['type']})")
-                            break
-
-                    if not found:
-                        # 如果是全新的关系，添加到列表
-                        rels_to_update.append(new_rel)
-                        logger.info(f"新增关系: {new_rel['from_id']}->{new_rel['to_id']} ({new_rel['type']})")
-
-                print("rels_to_update:", rels_to_update)
-
-            except Exception as e:
-                logger.error(f"关系更新失败: {str(e)}")
-                return
+        """
+        关系更新：复制前一章节关系到当前章节，然后用本章关系覆盖
 
-        # 4. 批量更新关系到当前章节
-        query = f"""
+        复制与覆盖在数据库端的一条查询中完成：
+        1. 将第 chapter-1 章的关系复制到本章（两端人物都出现在本章时），跳过本章有新关系的人物对；
+        2. 写入本章的新关系（本章出现的人物对整体替换继承来的同方向关系，无论类型）。
+        只有本章变化的关系作为参数发送，网络传输与内存占用只与变化量相关，而与关系总数无关。
+        """
+        # 本章关系按 (from_id, to_id, type) 去重，后出现的覆盖先出现的；
+        # 配合 apoc.merge.relationship 以 (类型, 章节, from_id, to_id) 为匹配条件，写入时即保证不产生重复关系
+        rels_by_key = {}
+        for r in self._relationship_cache.values():
+            r['chapter'] = chapter  # 确保新关系有正确的章节标记
+            rels_by_key[(r["from_id"], r["to_id"], r["type"])] = {
+                "from_id": r["from_id"],
+                "to_id": r["to_id"],
+                "type": r["type"],
+                "intensity": r.get("intensity", 3),
+                "awareness": r.get("awareness", "未知"),
+                "new_detail": r.get("new_detail", ""),
+                "reason": r.get("reason", "")
+            }
+        rels_data = list(rels_by_key.values())
+        override_pairs = list({(r["from_id"], r["to_id"]) for r in rels_data})
+        logger.debug("第 %s 章待写入关系: %s", chapter, rels_data)
+
+        # 写入本章新关系
+        write_rels = """
+        CALL {
+            WITH ch
             UNWIND $rels AS rel_data
-            MATCH (a:Character:Chapter{chapter} {{id: rel_data.from_id}})
-            MATCH (b:Character:Chapter{chapter} {{id: rel_data.to_id}})
+            MATCH (ch)<-[:APPEARS_IN]-(a:Character {id: rel_data.from_id})
+            MATCH (ch)<-[:APPEARS_IN]-(b:Character {id: rel_data.to_id})
             CALL apoc.merge.relationship(
                 a,
                 rel_data.type,
-                {{  // 匹配条件：关系类型、章节、from_id、to_id
+                {  // 匹配条件：关系类型、章节、from_id、to_id
                     chapter: $chapter,
                     from_id: rel_data.from_id,
                     to_id: rel_data.to_id
-                }},
-                {{  // 如果匹配到，设置这些属性
+                },
+                {  // 如果匹配到，设置这些属性
                     intensity: rel_data.intensity,
                     awareness: COALESCE(rel_data.awareness, '未知'),
                     new_detail: COALESCE(rel_data.new_detail, ''),
                     reason: COALESCE(rel_data.reason, ''),
                     chapter: $chapter
-                }},
+                },
                 b,
-                {{  // 如果没有匹配到，创建关系时的属性
+                {  // 如果没有匹配到，创建关系时的属性
                     intensity: rel_data.intensity,
                     awareness: COALESCE(rel_data.awareness, '未知'),
                     new_detail: COALESCE(rel_data.new_detail, ''),
@@ -385,56 +709,113 @@ class KnowledgeGraphBuilder:
                     chapter: $chapter,
                     from_id: rel_data.from_id,
                     to_id: rel_data.to_id
-                }}
+                }
             ) YIELD rel
-            RETURN count(rel) as count
+            RETURN count(rel) AS updated
+        }
+        """
+
+        if chapter == 0:
+            # 第0章直接使用初始关系，没有可继承的关系
+            query = """
+            MATCH (ch:Chapter {number: $chapter})
+            """ + write_rels + """
+            RETURN 0 AS inherited, updated
+            """
+        else:
+            # 先在数据库端复制上一章关系（跳过本章覆盖的人物对），再写入本章新关系
+            query = """
+            MATCH (ch:Chapter {number: $chapter})
+            CALL {
+                WITH ch
+                MATCH (:Chapter {number: $prev_chapter})<-[:APPEARS_IN]-(a:Character)-[r]->(b:Character)
+                WHERE r.chapter = $prev_chapter
+                  AND NOT [a.id, b.id] IN $override_pairs
+                  AND (a)-[:APPEARS_IN]->(ch)
+                  AND (b)-[:APPEARS_IN]->(ch)
+                CALL apoc.merge.relationship(
+                    a,
+                    type(r),
+                    {chapter: $chapter, from_id: a.id, to_id: b.id},
+                    {
+                        intensity: COALESCE(r.intensity, 3),
+                        awareness: COALESCE(r.awareness, '未知'),
+                        new_detail: COALESCE(r.new_detail, ''),
+                        reason: COALESCE(r.reason, ''),
+                        chapter: $chapter
+                    },
+                    b,
+                    {
+                        intensity: COALESCE(r.intensity, 3),
+                        awareness: COALESCE(r.awareness, '未知'),
+                        new_detail: COALESCE(r.new_detail, ''),
+                        reason: COALESCE(r.reason, ''),
+                        chapter: $chapter,
+                        from_id: a.id,
+                        to_id: b.id
+                    }
+                ) YIELD rel
+                RETURN count(rel) AS inherited
+            }
+            """ + write_rels + """
+            RETURN inherited, updated
             """
 
         try:
-            # 准备关系数据
-            rels_data = []
-            for r in rels_to_update:
-                rel_data = {
-                    "from_id": r["from_id"],
-                    "to_id": r["to_id"],
-                    "type": r["type"],
-                    "intensity": r.get("intensity", 3),
-                    "awareness": r.get("awareness", "未知"),
-                    "new_detail": r.get("new_detail", ""),
-                    "reason": r.get("reason", "")
-                }
-                rels_data.append(rel_data)
-                print("rels_data:",rels_data)
-
-            # 使用字符串替换来处理章节标签
-            query = query.replace(":Chapter$chapter", f":Chapter{chapter}")
-            print("query:", query)
-
             result = self.connector.execute_query(query, {
                 "rels": rels_data,
-                "chapter": chapter
+                "override_pairs": [list(pair) for pair in override_pairs],
+                "chapter": chapter,
+                "prev_chapter": chapter - 1
             })
-            print("result:",result)
-            logger.info(f"更新了 {result[0]['count']} 条关系到章节 {chapter}")
+            if not result:
+                logger.warning(f"第 {chapter} 章尚未登记，跳过关系更新")
+                return
+            logger.info(f"第 {chapter} 章关系: 从章节 {chapter - 1} 继承 {result[0]['inherited']} 条，"
+                        f"写入本章关系 {result[0]['updated']} 条（覆盖 {len(override_pairs)} 对人物）")
         except Exception as e:
             logger.error(f"关系更新失败: {str(e)}")
+            raise
 
-    def cleanup_duplicate_relationships(self):
-        """清理数据库中所有重复的关系"""
-        query = """
-        MATCH (a:Character)-[r]->(b:Character)      
+    def cleanup_duplicate_relationships(self, chapter: Optional[int] = None):
+        """
+        清理重复的人物关系（维护命令，需手动调用）
+
+        正常写入时关系以 (类型, 章节, from_id, to_id) 合并，不会产生重复，
+        本方法只用于修复旧数据或外部写入造成的重复。
+
+        参数:
+        - chapter (int): 只清理指定章节的关系；为 None 时扫描整个数据库的人物关系
+
+        返回:
+        - int: 删除的关系数量
+        """
+        if chapter is None:
+            match = """
+            MATCH (a:Character)-[r]->(b:Character)
+            """
+        else:
+            match = """
+            MATCH (:Chapter {number: $chapter})<-[:APPEARS_IN]-(a:Character)-[r]->(b:Character)
+            WHERE r.chapter = $chapter
+            """
+        query = match + """
         WITH a, b, type(r) as relType, r.chapter as chapter, collect(r) as rels
         WHERE size(rels) > 1
         UNWIND rels[1..] AS duplicateRel
         DELETE duplicateRel
         RETURN count(duplicateRel) as deletedCount
         """
-        # 上面这段查询的作用是将所有重复的关系找出来，并删除多余的，只保留一条
+        # 上面这段查询的作用是将重复的关系找出来，并删除多余的，只保留一条
         try:
-            result = self.connector.execute_query(query)
-            logger.info(f"清理了 {result[0]['deletedCount']} 条重复关系")
+            result = self.connector.execute_query(query, {"chapter": chapter})
+            deleted = result[0]['deletedCount'] if result else 0
+            scope = "全部章节" if chapter is None else f"第 {chapter} 章"
+            logger.info(f"{scope}清理了 {deleted} 条重复关系")
+            return deleted
         except Exception as e:
             logger.error(f"清理重复关系失败: {str(e)}")
+            return 0
 
     def check_chapter_relationships(self, chapter: int, show_all: bool = False):
         """检查指定章节的角色关系情况，检测重复关系
@@ -446,8 +827,9 @@ class KnowledgeGraphBuilder:
         Returns:
             list: 查询结果列表
         """
-        query = f"""
-        MATCH (a:Character:Chapter{chapter})-[r]->(b:Character:Chapter{chapter})
+        query = """
+        MATCH (:Chapter {number: $chapter})<-[:APPEARS_IN]-(a:Character)-[r]->(b:Character)
+        WHERE r.chapter = $chapter
         RETURN 
             a.id as from_id, 
             b.id as to_id, 
@@ -460,7 +842,7 @@ class KnowledgeGraphBuilder:
         """
 
         try:
-            results = self.connector.execute_query(query) or []
+            results = self.connector.execute_query(query, {"chapter": chapter}) or []
 
             print(f"\n=== 第{chapter}章关系检查 ===")
             print(f"共发现 {len(results)} 条关系记录")
@@ -502,6 +884,7 @@ class KnowledgeGraphBuilder:
         此函数用于在特定章节中创建或更新一个场景节点。它要求传入的属性中必须包含"id"字段，
         以确保场景的唯一性。其他场景属性如"name", "place", "time_period", "pov_character", 和 "owner"可以通过
         properties参数进行指定。如果这些属性未被指定，它们将使用默认值。
+        实际写入由 ingest_chapter_graph 完成，本方法只是单个场景的包装。
 
         参数:
         - chapter (int): 场景所属的章节编号
@@ -516,35 +899,7 @@ class KnowledgeGraphBuilder:
         # 检查properties中是否包含"id"属性，如果不包含，则抛出ValueError
         if "id" not in properties:
             raise ValueError("创建Scene节点必须包含id属性")
-
-        # 定义默认的场景属性，如果properties中未提供这些属性，将使用这些默认值
-        default_props = {
-            "name": None,
-            "place": None,
-            "time_period": "UNSPECIFIED",
-            "pov_character": None,
-            "owner": None
-        }
-        # 准备场景属性，合并默认属性和用户提供的属性
-        props = self._prepare_properties(properties, default_props)
-
-        # 构建Cypher查询，用于创建或更新场景节点
-        query = f"""
-        MERGE (s:Scene {{id: $id}})
-        SET s:Chapter{chapter}, 
-            s += $props
-        RETURN s
-        """
-        try:
-            # 执行Cypher查询，创建或更新场景节点，并返回结果
-            result = self.connector.execute_query(query, {"id": props["id"], "props": props})
-            # 记录创建或更新场景节点的结果
-            logger.debug("创建场景 %s 结果: %s", props.get("name", props["id"]), result)
-            return result
-        except Exception as e:
-            # 如果在执行查询时发生异常，记录错误信息并重新抛出异常
-            logger.error(f"创建场景节点失败: {e}")
-            raise
+        return self.ingest_chapter_graph(chapter, scenes=[properties])
 
     def create_event(self, chapter: int, **properties):
         """
@@ -552,6 +907,7 @@ class KnowledgeGraphBuilder:
 
         该方法主要用于在特定章节中创建一个事件节点，并根据提供的属性进行设置
         同时，如果事件有关联的场景或参与者，也会创建相应的关联关系
+        实际写入由 ingest_chapter_graph 完成，本方法只是单个事件的包装。
 
         参数:
         - chapter (int): 事件所属的章节编号
@@ -566,6 +922,27 @@ class KnowledgeGraphBuilder:
         # 检查是否提供了必需的'id'属性
         if "id" not in properties:
             raise ValueError("创建Event节点必须包含id属性")
+        self.ingest_chapter_graph(chapter, events=[properties])
+
+    def _prepare_scene(self, scene: Dict) -> Dict:
+        """合并场景的默认属性"""
+        if "id" not in scene:
+            raise ValueError("创建Scene节点必须包含id属性")
+
+        # 定义默认的场景属性，如果未提供这些属性，将使用这些默认值
+        default_props = {
+            "name": None,
+            "place": None,
+            "time_period": "UNSPECIFIED",
+            "pov_character": None,
+            "owner": None
+        }
+        return self._prepare_properties(scene, default_props)
+
+    def _prepare_event(self, event: Dict) -> Dict:
+        """合并事件的默认属性，并将 emotional_impact 序列化为 JSON 字符串"""
+        if "id" not in event:
+            raise ValueError("创建Event节点必须包含id属性")
 
         # 定义事件的默认属性值
         default_props = {
@@ -579,61 +956,121 @@ class KnowledgeGraphBuilder:
             "consequences": []
         }
 
+        event = dict(event)
         # 处理emotional_impact，如果是字典则转为JSON字符串
-        if "emotional_impact" in properties and isinstance(properties["emotional_impact"], dict):
-            properties["emotional_impact"] = json.dumps(properties["emotional_impact"], ensure_ascii=False)
+        if isinstance(event.get("emotional_impact"), dict):
+            event["emotional_impact"] = json.dumps(event["emotional_impact"], ensure_ascii=False)
 
-        # 合并默认属性和传入的属性，确保所有属性都被定义
-        props = self._prepare_properties(properties, default_props)
+        return self._prepare_properties(event, default_props)
 
-        # 创建事件节点的Cypher查询
-        query = f"""
-        MERGE (e:Event {{id: $id}})
-        SET e:Chapter{chapter}, 
-            e += $props
-        RETURN e
+    def ingest_chapter_graph(self, chapter: int, scenes: Optional[List[Dict]] = None,
+                             events: Optional[List[Dict]] = None):
         """
+        批量写入章节的场景、事件及其关联关系
 
-        # 执行查询并处理异常
-        try:
-            result = self.connector.execute_query(query, {"id": props["id"], "props": props})
-            logger.debug("创建事件 %s 结果: %s", props.get("name", props["id"]), result)
-        except Exception as e:
-            logger.error(f"创建事件节点失败: {e}")
-            raise
+        每类数据只发送一条 UNWIND 参数化查询：
+        1. 场景节点
+        2. 事件节点
+        3. 人物 -[:IN_EVENT]-> 事件
+        4. 事件 -[:OCCURRED_IN]-> 场景
+        因此一章的写入往返次数固定，不再随事件数和参与者数增长。
+
+        参数:
+        - chapter (int): 所属章节编号
+        - scenes (list): 场景属性字典列表，每项必须包含"id"
+        - events (list): 事件属性字典列表，每项必须包含"id"
 
-        # 如果有参与者，创建参与者与事件的关联关系
-        for participant in props.get("participants", []):
-            rel_query = """
-            MERGE (p:Character {id: $character_id})
-            MERGE (e:Event {id: $event_id})
+        返回:
+        - dict: 各类写入的数量统计
+        """
+        scene_props = [self._prepare_scene(scene) for scene in scenes or []]
+        event_props = [self._prepare_event(event) for event in events or []]
+
+        participations = [
+            {"character_id": participant, "event_id": event["id"]}
+            for event in event_props
+            for participant in event["participants"]
+        ]
+        scene_links = [
+            {"scene_id": event["scene_id"], "event_id": event["id"]}
+            for event in event_props
+            if event["scene_id"] is not None
+        ]
+
+        counts = {"scenes": 0, "events": 0, "participations": 0, "scene_links": 0}
+
+        if scene_props or event_props:
+            # 登记章节
+            try:
+                self.connector.execute_query("MERGE (:Chapter {number: $chapter})", {"chapter": chapter})
+            except Exception as e:
+                logger.error(f"登记章节失败: {e}")
+                raise
+
+        if scene_props:
+            query = """
+            UNWIND $scenes AS scene
+            MERGE (s:Scene {id: scene.id})
+            SET s += scene,
+                s.chapter = $chapter
+            RETURN count(s) AS count
+            """
+            try:
+                result = self.connector.execute_query(query, {"scenes": scene_props, "chapter": chapter})
+                counts["scenes"] = result[0]["count"]
+            except Exception as e:
+                logger.error(f"批量创建场景节点失败: {e}")
+                raise
+
+        if event_props:
+            query = """
+            UNWIND $events AS event
+            MERGE (e:Event {id: event.id})
+            SET e += event,
+                e.chapter = $chapter
+            RETURN count(e) AS count
+            """
+            try:
+                result = self.connector.execute_query(query, {"events": event_props, "chapter": chapter})
+                counts["events"] = result[0]["count"]
+            except Exception as e:
+                logger.error(f"批量创建事件节点失败: {e}")
+                raise
+
+        if participations:
+            query = """
+            UNWIND $links AS link
+            MERGE (p:Character {id: link.character_id})
+            WITH p, link
+            MATCH (e:Event {id: link.event_id})
             MERGE (p)-[r:IN_EVENT {chapter: $chapter}]->(e)
-            RETURN r
+            RETURN count(r) AS count
             """
             try:
-                self.connector.execute_query(rel_query, {
-                    "character_id": participant,
-                    "event_id": props["id"],
-                    "chapter": chapter
-                })
+                result = self.connector.execute_query(query, {"links": participations, "chapter": chapter})
+                counts["participations"] = result[0]["count"]
             except Exception as e:
-                logger.error(f"创建参与关系失败: {participant} -> {props['id']} - {e}")
+                logger.error(f"批量创建参与关系失败: {e}")
+                raise
 
-        # 如果有场景ID，将事件与场景关联
-        if "scene_id" in props:
-            scene_query = """
-            MERGE (s:Scene {id: $scene_id})
-            MERGE (e:Event {id: $event_id})
+        if scene_links:
+            query = """
+            UNWIND $links AS link
+            MERGE (s:Scene {id: link.scene_id})
+            WITH s, link
+            MATCH (e:Event {id: link.event_id})
             MERGE (e)-[r:OCCURRED_IN]->(s)
-            RETURN r
+            RETURN count(r) AS count
             """
             try:
-                self.connector.execute_query(scene_query, {
-                    "scene_id": props["scene_id"],
-                    "event_id": props["id"]
-                })
+                result = self.connector.execute_query(query, {"links": scene_links})
+                counts["scene_links"] = result[0]["count"]
             except Exception as e:
-                logger.error(f"关联场景失败: {props['id']} -> {props['scene_id']} - {e}")
+                logger.error(f"批量关联场景失败: {e}")
+                raise
+
+        logger.debug("第 %s 章批量写入结果: %s", chapter, counts)
+        return counts
 
     def process_chapter(self, json_file: str):
         """
@@ -656,24 +1093,11 @@ class KnowledgeGraphBuilder:
         chapter = data['chapter']
         logger.info(f"开始处理第 {chapter} 章数据...")
 
-        # 清理可能存在的重复关系
-        self.cleanup_duplicate_relationships()
-
         # 清理当前章节的关系缓存
         self._relationship_cache = {}  # 完全清空关系缓存
 
         # 更新人物缓存
-        updated_characters = set()  # 存入的还是角色的ID
-        for character in data.get('characters', []):
-            character_id = character['id']
-            if character_id in self._character_cache:
-                # 合并更新属性
-                self._character_cache[character_id].update(character)
-                updated_characters.add(character_id)
-            else:
-                # 新增人物
-                self._character_cache[character_id] = character
-                updated_characters.add(character_id)
+        updated_characters = self._merge_character_cache(data.get('characters', []))  # 存入的还是角色的ID
 
         # 更新关系缓存
         updated_rels = set()
@@ -687,18 +1111,54 @@ class KnowledgeGraphBuilder:
                 self._relationship_cache[rel_key] = rel
             updated_rels.add(rel_key)
 
-        # 处理场景和事件
-        for scene in data.get('scenes', []):
-            self.create_scene(chapter, **scene)
-        for event in data.get('events', []):
-            self.create_event(chapter, **event)
+        # 批量处理场景和事件
+        self.ingest_chapter_graph(chapter, data.get('scenes', []), data.get('events', []))
 
-        # 更新Neo4j
+        # 更新Neo4j（任一步骤失败都会抛出异常，章节不会被标记为完成）
         self._update_characters(chapter)
         self._update_relationships(chapter)
+        self._mark_chapter_completed(chapter)
 
         logger.info(f"✅ 第 {chapter} 章处理完成，更新了 {len(updated_characters)} 个人物和 {len(updated_rels)} 条关系")
 
+    def _merge_character_cache(self, characters: List[Dict]) -> set:
+        """将章节中的人物数据合并到人物缓存，返回更新的人物ID集合"""
+        updated_characters = set()
+        for character in characters:
+            character_id = character['id']
+            if character_id in self._character_cache:
+                # 合并更新属性
+                self._character_cache[character_id].update(character)
+            else:
+                # 新增人物
+                self._character_cache[character_id] = character
+            updated_characters.add(character_id)
+        return updated_characters
+
+    def restore_caches(self, initial_file: str, chapter_files: List[str]):
+        """
+        从已保存的初始数据和章节文件恢复人物缓存，不写入数据库
+
+        断点续跑时，已写入知识图谱的章节不再重新导入，但后续章节的导入依赖累积的人物缓存，
+        因此按章节顺序重放缓存更新。
+
+        参数:
+        - initial_file (str): 初始数据（第0章）JSON文件路径
+        - chapter_files (list): 按章节顺序排列的章节JSON文件路径
+        """
+        with open(initial_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self._initial_relationships = data.get('relationships', [])
+        self._character_cache = {p['id']: p for p in data.get('characters', [])}
+
+        for json_file in chapter_files:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                self._merge_character_cache(json.load(f).get('characters', []))
+
+        # 关系缓存只保存正在导入章节的关系，导入下一章时会重新填充
+        self._relationship_cache = {}
+        logger.info(f"已从 {len(chapter_files)} 个章节文件恢复人物缓存，共 {len(self._character_cache)} 个人物")
+
     def get_character_profile(self, character_id: str, chapter: int):
         """
         查询人物完整档案
@@ -716,55 +1176,126 @@ class KnowledgeGraphBuilder:
         返回:
         - dict: 包含人物基本信息、关系和参与事件的字典。如果未找到人物，则返回 {"error": "Character not found"}。
         """
-        # 1. 查询基本信息
-        query = f"""
-                MATCH (p:Character:Chapter{chapter} {{id: $character_id}})
-                RETURN p {{.*}} as properties
-                """
-        character_info = self.connector.execute_query(query, {"character_id": character_id})
-
-        if not character_info:
+        profiles = self.get_character_profiles([character_id], chapter)
+        if character_id not in profiles:
             return {"error": "Character not found"}
+        return profiles[character_id]
 
-        # 2. 修复关系查询 - 添加参数化查询
-        rel_query = f"""
-            MATCH (p:Character:Chapter{chapter} {{id: $character_id}})-[r]->(other:Character:Chapter{chapter})
-            WHERE r.chapter = $chapter 
-            RETURN {{
-                character_id: other.id,
-                name: other.name,
-                type: TYPE(r),
-                intensity: r.intensity,
-                awareness: r.awareness,
-                new_detail: r.new_detail,
-                chapter: r.chapter
-            }} AS relationship
-            """
-        relationships = self.connector.execute_query(rel_query, {
-            "character_id": character_id,
-            "chapter": chapter  # 添加chapter参数
+    def get_character_profiles(self, character_ids: List[str], chapter: int) -> Dict[str, Dict]:
+        """
+        批量查询多个人物在指定章节的完整档案
+
+        基本信息、关系网络和参与事件通过一条查询（OPTIONAL MATCH + collect）一次取回，
+        每个人物只占一行结果，整章所有人物只需一次数据库往返。
+
+        参数:
+        - character_ids (list): 人物ID列表
+        - chapter (int): 章节号
+
+        返回:
+        - dict: 以人物ID为键的档案字典，格式与 get_character_profile 相同；未找到的人物不会出现在结果中
+        """
+        if not character_ids:
+            return {}
+
+        records = self.connector.execute_query(CHARACTER_PROFILES_QUERY, {
+            "character_ids": list(character_ids),
+            "chapter": chapter
         }) or []
-        print("relationships:",relationships)
-
-        # 3. 查询人物参与的事件
-        events_query = f"""
-                    MATCH (p:Character:Chapter{chapter} {{id: $character_id}})-[r:IN_EVENT]->(e:Event:Chapter{chapter})-[o:OCCURRED_IN]->(s:Scene:Chapter{chapter})
-                    RETURN 
-                        e.id as event_id,
-                        e.name as event_name,
-                        e.order as event_order,
-                        e.details as details,
-                        s.id as scene_id,
-                        s.name as scene_name,
-                        s.place as scene_place,
-                        e.emotional_impact as emotional_impact,
-                        e.consequences as consequences
-                    ORDER BY e.order
-                    """
-
-        events = self.connector.execute_query(events_query, {"character_id": character_id})
-
-        # 情感影响处理逻辑
+        return self._build_character_profiles(records)
+
+    async def _a_execute_query(self, query: str, parameters: Optional[Dict] = None):
+        """异步执行查询：有异步连接器时使用异步连接器，否则在线程中使用同步连接器，均不阻塞事件循环"""
+        if self.async_connector is None:
+            return await asyncio.to_thread(self.connector.execute_query, query, parameters)
+        return await self.async_connector.execute_query(query, parameters)
+
+    async def a_get_character_profiles(self, character_ids: List[str], chapter: int) -> Dict[str, Dict]:
+        """
+        get_character_profiles 的异步版本，不阻塞事件循环（见 _a_execute_query）
+        """
+        if not character_ids:
+            return {}
+
+        records = await self._a_execute_query(CHARACTER_PROFILES_QUERY, {
+            "character_ids": list(character_ids),
+            "chapter": chapter
+        }) or []
+        return self._build_character_profiles(records)
+
+    def get_characters_events(self, character_ids: List[str], start_chapter: int, end_chapter: int,
+                              limit: int) -> Dict[str, List[Dict]]:
+        """
+        批量查询多个人物在章节区间 [start_chapter, end_chapter] 内参与的事件
+
+        所有人物的事件通过一次查询取回，按章节和事件顺序排序，每个人物最多返回 limit 条。
+
+        参数:
+        - character_ids (list): 人物ID列表
+        - start_chapter (int): 起始章节（含）
+        - end_chapter (int): 结束章节（含）
+        - limit (int): 每个人物返回的最大事件数
+
+        返回:
+        - dict: 以人物ID为键的事件列表；情感影响只保留该人物的部分，未找到的人物对应空列表
+        """
+        if not character_ids or start_chapter > end_chapter:
+            return {character_id: [] for character_id in character_ids}
+
+        records = self.connector.execute_query(
+            CHARACTERS_EVENTS_QUERY,
+            self._characters_events_params(character_ids, start_chapter, end_chapter, limit)
+        ) or []
+        return self._build_characters_events(character_ids, records)
+
+    async def a_get_characters_events(self, character_ids: List[str], start_chapter: int, end_chapter: int,
+                                      limit: int) -> Dict[str, List[Dict]]:
+        """
+        get_characters_events 的异步版本，不阻塞事件循环（见 _a_execute_query）
+        """
+        if not character_ids or start_chapter > end_chapter:
+            return {character_id: [] for character_id in character_ids}
+
+        records = await self._a_execute_query(
+            CHARACTERS_EVENTS_QUERY,
+            self._characters_events_params(character_ids, start_chapter, end_chapter, limit)
+        ) or []
+        return self._build_characters_events(character_ids, records)
+
+    @staticmethod
+    def _characters_events_params(character_ids: List[str], start_chapter: int, end_chapter: int,
+                                  limit: int) -> Dict:
+        """批量事件查询的参数"""
+        return {
+            "character_ids": list(dict.fromkeys(character_ids)),
+            "start_chapter": start_chapter,
+            "end_chapter": end_chapter,
+            "limit": int(limit)
+        }
+
+    def _build_characters_events(self, character_ids: List[str], records: List[Dict]) -> Dict[str, List[Dict]]:
+        """将批量事件查询结果整理为以人物ID为键的字典"""
+        events = {character_id: [] for character_id in character_ids}
+        for record in records:
+            character_id = record["character_id"]
+            events[character_id] = self._parse_emotional_impact(record["events"], character_id)
+        return events
+
+    def _build_character_profiles(self, records: List[Dict]) -> Dict[str, Dict]:
+        """将查询结果整理为以人物ID为键的档案字典"""
+        profiles = {}
+        for record in records:
+            character_id = record["character_id"]
+            profiles[character_id] = {
+                "properties": record["properties"],
+                "relationships": record["relationships"],
+                "events": self._parse_emotional_impact(record["events"], character_id)
+            }
+        return profiles
+
+    @staticmethod
+    def _parse_emotional_impact(events: List[Dict], character_id: str) -> List[Dict]:
+        """情感影响处理逻辑：只保留指定人物的情感影响"""
         for event in events:
             if event["emotional_impact"]:
                 try:
@@ -774,20 +1305,22 @@ class KnowledgeGraphBuilder:
                     event["emotional_impact"] = "数据格式错误"
             else:
                 event["emotional_impact"] = "无记录"
+        return events
 
-        return {
-            "properties": character_info[0]['properties'],
-            "relationships": [r["relationship"] for r in relationships],
-            "events": events
-        }
-
-    def save_character_memories_kg(self, chapter: int, base_path: str = None):
+    def save_character_memories_kg(self, chapter: int, base_path: str = None, per_character_files: bool = False):
         """
         保存所有角色的记忆到JSON文件
 
+        整章所有人物的档案通过一次查询取回，写入一个紧凑的章节文件 chapter_{n}_memories.json，
+        先写临时文件再原子替换，读取方不会看到写了一半的文件。
+
         参数:
             chapter (int): 章节编号
             base_path (str): 可选的自定义基础路径
+            per_character_files (bool): 是否同时在 chapter_{n}_memories/ 目录下为每个人物保存单独的文件
+
+        返回:
+            dict: 以人物ID为键的记忆字典
         """
         try:
             # 确定基础路径
@@ -801,42 +1334,53 @@ class KnowledgeGraphBuilder:
             else:
                 # 处理自定义路径（支持字符串或Path对象）
                 base_path = Path(base_path)  # 确保转换为Path对象
+            base_path.mkdir(parents=True, exist_ok=True)
 
-            # 创建章节记忆文件夹（确保基础路径正确）
-            chapter_dir = base_path / f"chapter_{chapter}_memories"
-            chapter_dir.mkdir(parents=True, exist_ok=True)
-
-            # 获取本章所有人物ID
-            character_ids = self.get_chapter_character_ids(chapter)
+            # 一次查询获取本章所有人物的档案
+            records = self.connector.execute_query(CHAPTER_PROFILES_QUERY, {"chapter": chapter}) or []
+            profiles = self._build_character_profiles(records)
 
-            formatted_memory = {}
-            # 为每个人物保存记忆
-            for character_id in character_ids:
-                memory = self.get_character_profile(character_id, chapter)
-
-                # 确保记忆格式与MemoryAgent一致
-                formatted_memory = {
+            # 确保记忆格式与MemoryAgent一致
+            memories = {
+                character_id: {
                     "chapter": chapter,
                     "properties": memory["properties"],
                     "relationships": memory["relationships"],
                     "events": memory["events"]
                 }
+                for character_id, memory in profiles.items()
+            }
 
-                # 构建记忆文件路径
-                memory_file = chapter_dir / f"{character_id}_memory.json"
-
-                # 保存JSON文件
-                with open(memory_file, 'w', encoding='utf-8') as f:
-                    json.dump(formatted_memory, f, ensure_ascii=False, indent=2)
+            # 写入章节记忆文件（临时文件 + 原子替换）
+            memory_file = base_path / f"chapter_{chapter}_memories.json"
+            self._write_json_atomic(memory_file, {"chapter": chapter, "characters": memories})
+            logger.info(f"✅ 已保存第 {chapter} 章 {len(memories)} 个角色的记忆到 {memory_file}")
 
-                logger.info(f"✅ 已保存角色 {character_id} 的记忆到 {memory_file}")
+            if per_character_files:
+                # 创建章节记忆文件夹
+                chapter_dir = base_path / f"chapter_{chapter}_memories"
+                chapter_dir.mkdir(parents=True, exist_ok=True)
+                for character_id, memory in memories.items():
+                    self._write_json_atomic(chapter_dir / f"{character_id}_memory.json", memory, indent=2)
+                logger.info(f"✅ 已保存 {len(memories)} 个角色的单独记忆文件到 {chapter_dir}")
 
-            return formatted_memory
+            return memories
 
         except Exception as e:
             logger.error(f"保存角色记忆失败: {str(e)}")
             raise  # 向上抛出异常，让调用方处理
 
+    @staticmethod
+    def _write_json_atomic(path: Path, data, indent: Optional[int] = None):
+        """先写入同目录下的临时文件，再用 os.replace 原子替换目标文件"""
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if indent is None:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            else:
+                json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+
     def get_chapter_character_ids(self, chapter: int) -> list:
         """
         获取指定章节的所有人物ID
@@ -847,12 +1391,12 @@ class KnowledgeGraphBuilder:
         返回:
             list: 人物ID列表
         """
-        query = f"""
-        MATCH (p:Character:Chapter{chapter})
+        query = """
+        MATCH (:Chapter {number: $chapter})<-[:APPEARS_IN]-(p:Character)
         RETURN p.id as character_id
         """
         try:
-            result = self.connector.execute_query(query)
+            result = self.connector.execute_query(query, {"chapter": chapter})
             return [record['character_id'] for record in result]
         except Exception as e:
             logger.error(f"获取章节人物ID失败: {e}")
@@ -1,6 +1,8 @@
+import asyncio
 import os
+import threading
 from dotenv import load_dotenv
-from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase, GraphDatabase
 from typing import Dict, Optional
 import logging
 
@@ -12,11 +14,18 @@ logger = logging.getLogger(__name__)
 class Neo4jConnector:
     """
     Neo4j数据库连接器类，用于与Neo4j数据库进行交互。
+
+    同一进程内连接相同 URI 和用户的连接器共享一个驱动（及其连接池），
+    驱动按引用计数管理：最后一个连接器关闭时才真正关闭驱动。
     """
+    # 进程级驱动注册表：{(uri, user): [driver, 引用计数]}
+    _drivers = {}
+    _drivers_lock = threading.Lock()
+
     def __init__(self):
         """
         初始化Neo4j数据库连接
-        该方法从环境变量中读取Neo4j数据库的URI、用户名和密码，并使用这些信息建立数据库连接
+        该方法从环境变量中读取Neo4j数据库的URI、用户名和密码，并获取（必要时创建）对应的共享驱动
         如果未设置密码环境变量，则抛出ValueError异常
         """
         load_dotenv()
@@ -32,25 +41,45 @@ class Neo4jConnector:
         if not self.password:
             raise ValueError("NEO4J_PASSWORD环境变量未设置")
 
-        # 增加连接池配置
-        # 使用获取到的URI、用户名和密码建立与Neo4j数据库的连接，并配置连接池
-        self.driver = GraphDatabase.driver(
-            self.uri,
-            auth=(self.user, self.password),
-            max_connection_lifetime=30 * 60,  # 30分钟
-            max_connection_pool_size=50,
-            connection_timeout=10  # 10秒
-        )
+        self._driver_key = (self.uri, self.user)
+        with Neo4jConnector._drivers_lock:
+            entry = Neo4jConnector._drivers.get(self._driver_key)
+            if entry is None:
+                # 增加连接池配置
+                # 使用获取到的URI、用户名和密码建立与Neo4j数据库的连接，并配置连接池
+                driver = GraphDatabase.driver(
+                    self.uri,
+                    auth=(self.user, self.password),
+                    max_connection_lifetime=30 * 60,  # 30分钟
+                    max_connection_pool_size=50,
+                    connection_timeout=10  # 10秒
+                )
+                entry = [driver, 0]
+                Neo4jConnector._drivers[self._driver_key] = entry
+                logger.info("✅ Neo4j驱动初始化完成")
+            entry[1] += 1
+        self.driver = entry[0]
+        self._closed = False
         logger.info("✅ Neo4j连接器初始化完成")
 
     def close(self):
         """
         关闭Neo4j数据库连接。
-        该方法检查是否存在一个名为'driver'的属性，如果存在，则关闭该连接，并在日志中记录关闭连接的信息。
-    """
-        if hasattr(self, 'driver'):
-            self.driver.close()
-            logger.info("Neo4j连接已关闭")
+        释放本连接器对共享驱动的引用，当没有连接器再使用该驱动时关闭驱动，并在日志中记录关闭连接的信息。
+        重复调用是安全的。
+        """
+        if not hasattr(self, 'driver') or self._closed:
+            return
+        self._closed = True
+        with Neo4jConnector._drivers_lock:
+            entry = Neo4jConnector._drivers.get(self._driver_key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                entry[0].close()
+                del Neo4jConnector._drivers[self._driver_key]
+                logger.info("Neo4j连接已关闭")
 
     def execute_query(self, query: str, parameters: Optional[Dict] = None):
         """
@@ -71,4 +100,131 @@ class Neo4jConnector:
             except Exception as e:
                 # 如果查询执行失败，记录错误日志并重新抛出异常
                 logger.error(f"执行查询失败: {query[:100]}... - {str(e)}")
-                raise
\ No newline at end of file
+                raise
+
+
+# close_sync 在运行中的事件循环里创建的驱动关闭任务，保留引用直到任务完成
+_pending_close_tasks = set()
+
+
+def _on_driver_closed(task):
+    """驱动关闭任务完成回调：移除任务引用并记录结果"""
+    _pending_close_tasks.discard(task)
+    if task.cancelled():
+        logger.warning("关闭Neo4j异步驱动的任务被取消")
+    elif task.exception() is not None:
+        logger.warning(f"关闭Neo4j异步驱动失败: {task.exception()}")
+    else:
+        logger.info("Neo4j异步连接已关闭")
+
+
+class AsyncNeo4jConnector:
+    """
+    异步 Neo4j 数据库连接器，基于 neo4j 异步驱动，接口与 Neo4jConnector 相同（方法为协程）。
+
+    供 asyncio 工作流使用，查询知识图谱时不会阻塞事件循环。
+    与 Neo4jConnector 一样，同一进程内相同 URI 和用户的连接器共享一个驱动，并按引用计数关闭。
+    注意异步驱动只能在同一个事件循环中使用。
+    """
+    # 进程级异步驱动注册表：{(uri, user): [driver, 引用计数]}
+    _drivers = {}
+    _drivers_lock = threading.Lock()
+
+    def __init__(self):
+        """
+        初始化异步Neo4j数据库连接
+        连接参数与 Neo4jConnector 相同，均从环境变量中读取
+        如果未设置密码环境变量，则抛出ValueError异常
+        """
+        load_dotenv()
+        self.uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+        self.user = os.getenv("NEO4J_USERNAME", "neo4j")
+        self.password = os.getenv("NEO4J_PASSWORD")
+        if not self.password:
+            raise ValueError("NEO4J_PASSWORD环境变量未设置")
+
+        self._driver_key = (self.uri, self.user)
+        with AsyncNeo4jConnector._drivers_lock:
+            entry = AsyncNeo4jConnector._drivers.get(self._driver_key)
+            if entry is None:
+                driver = AsyncGraphDatabase.driver(
+                    self.uri,
+                    auth=(self.user, self.password),
+                    max_connection_lifetime=30 * 60,  # 30分钟
+                    max_connection_pool_size=50,
+                    connection_timeout=10  # 10秒
+                )
+                entry = [driver, 0]
+                AsyncNeo4jConnector._drivers[self._driver_key] = entry
+                logger.info("✅ Neo4j异步驱动初始化完成")
+            entry[1] += 1
+        self.driver = entry[0]
+        self._closed = False
+
+    def _release(self):
+        """释放本连接器对共享驱动的引用，如果是最后一个引用，返回需要关闭的驱动，否则返回 None"""
+        if not hasattr(self, 'driver') or self._closed:
+            return None
+        self._closed = True
+        with AsyncNeo4jConnector._drivers_lock:
+            entry = AsyncNeo4jConnector._drivers.get(self._driver_key)
+            if entry is None:
+                return None
+            entry[1] -= 1
+            if entry[1] > 0:
+                return None
+            del AsyncNeo4jConnector._drivers[self._driver_key]
+        return entry[0]
+
+    async def close(self):
+        """
+        关闭异步Neo4j数据库连接。
+        释放本连接器对共享驱动的引用，没有连接器再使用该驱动时关闭驱动。重复调用是安全的。
+        """
+        driver = self._release()
+        if driver is None:
+            return
+        await driver.close()
+        logger.info("Neo4j异步连接已关闭")
+
+    def close_sync(self):
+        """
+        在同步代码中关闭异步连接，引用计数规则与 close 相同。
+        有正在运行的事件循环时，驱动关闭作为任务交给该循环执行（本方法返回时驱动可能尚未关闭，
+        协程中应优先使用 await close()）；否则在新的事件循环中执行。
+        """
+        driver = self._release()
+        if driver is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            # 保留任务引用，避免任务在完成前被回收；完成后再记录结果
+            task = loop.create_task(driver.close())
+            _pending_close_tasks.add(task)
+            task.add_done_callback(_on_driver_closed)
+            return
+        try:
+            asyncio.run(driver.close())
+            logger.info("Neo4j异步连接已关闭")
+        except Exception as e:
+            logger.warning(f"关闭Neo4j异步驱动失败: {e}")
+
+    async def execute_query(self, query: str, parameters: Optional[Dict] = None):
+        """
+        使用给定的查询字符串和参数异步执行数据库查询。
+
+        :param query: 要执行的查询字符串。
+        :param parameters: 可选的参数字典，用于查询中的占位符替换。
+        :return: 查询结果的数据。
+        :raises: 如果查询执行失败，抛出异常。
+        """
+        async with self.driver.session() as session:
+            try:
+                result = await session.run(query, parameters or {})
+                return await result.data()
+            except Exception as e:
+                logger.error(f"执行查询失败: {query[:100]}... - {str(e)}")
+                raise
@@ -9,16 +9,15 @@ from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.teams import RoundRobinGroupChat
 # 项目模块
 from Agent.MemoryAgent import MemoryAgent
-from Agent.StoryGenAgent import create_agents
+from Agent.StoryGenAgent import create_agents, create_shortgoal_agent
 from Resource.tools.customJSONEncoder import CustomJSONEncoder
-from Resource.tools.read_json import read_max_index_file
+from Resource.tools.read_json import read_json, read_max_index_file
 from Resource.tools.decision import evaluate_plan
 from Resource.tools.extract_llm_content import extract_llm_content
 from Resource.tools.strip_markdown_codeblock import strip_markdown_codeblock
 from Resource.tools.to_valid_identifier import to_valid_identifier
 from Resource.template.storygen_prompt.shortgoal import SHORTGOAL_PROMPT_TEMPLATE
-from Resource.template.storygen_prompt.role_prompt import ROLE_PROMPT_TEMPLATE
-from Resource.template.story_template import story_plan_template, story_plan_example
+from Resource.template.storygen_prompt.role_prompt import ROLE_PROMPT
 
 
 
@@ -37,15 +36,24 @@ class StoryGenWorkflow:
     10. 私有方法 _create_team_from_config：根据配置创建 Agent 团队并构建协作流程。
     11. 私有方法 _save_chapter：将生成的章节保存为 JSON 文件，并更新知识图谱。
     12. 私有方法 _if_get_longgoal：判断是否实现了长期目标。
+    13. 私有方法 _generate_short_goal：使用独立的短期目标智能体生成一个候选短期目标。
+    14. 私有方法 _generate_short_goals：并发生成多个候选短期目标。
+    15. 私有方法 _generate_round_plan：为一个短期目标运行角色团队并生成故事方案。
+    16. 私有方法 _generate_round_plans：并发运行所有短期目标对应的角色团队。
+    17. 私有方法 _resume_from_saved_chapters：断点续跑，从已保存的章节恢复状态并继续生成。
 
 
     """
-    def __init__(self, model_client, maxround=1):
+    def __init__(self, model_client, maxround=1, num_candidates=3, max_concurrency=3, team_timeout=None,
+                 score_threshold=None, resume=False):
         # 设置模型客户端和最大轮次参数
         self.model_client = model_client  #设置模型客户端
         self.maxround = int(maxround)  #设置模型最大轮次参数, 所有角色智能体参与一次对话为一轮
+        self.num_candidates = int(num_candidates)  # 每章生成的候选短期目标（方案）数量
+        self.max_concurrency = max(1, int(max_concurrency))  # 并发调用 LLM 的最大数量
+        self.team_timeout = team_timeout  # 单个角色团队讨论的超时时间（秒），None 表示不限制
+        self.score_threshold = score_threshold  # 方案评分达到该阈值即提前结束评估，None 表示评完所有方案
         self.memory_agent = MemoryAgent()  # 初始化知识图谱连接
-        self.memory_agent.clear_all_chapter_data()
         self.current_chapter = 0  # 添加章节计数器(从0开始)
 
         # 加载初始数据（直接使用原始chapter_0.json）
@@ -59,18 +67,56 @@ class StoryGenWorkflow:
         self.longgoal = self.initial_data["longgoal"]
         self.agents_config = self.initial_data["characters"]  # 初始角色配置
 
-        # 直接调用MemoryAgent加载初始化人物和关系，保存至知识图谱
-        self.memory_agent.load_initial_data(init_file)
-
         # 存储上一章节的方案
         self.last_plan = None
 
+        if resume:
+            # 断点续跑：从已保存的章节继续
+            self._resume_from_saved_chapters(init_file)
+        else:
+            self.memory_agent.clear_all_chapter_data()
+            # 直接调用MemoryAgent加载初始化人物和关系，保存至知识图谱
+            self.memory_agent.load_initial_data(init_file)
+
         logging.info(
             f"初始化完成 - 标题: {self.title}, "
             f"角色数: {len(self.initial_data['characters'])}, "
             f"关系数: {len(self.initial_data['relationships'])}"
         )
 
+    def _resume_from_saved_chapters(self, init_file):
+        """
+        断点续跑：找到已保存的最大章节 chapter_N.json，核对知识图谱状态，
+        恢复 current_chapter / last_plan，只重新导入图谱中缺失的章节
+
+        章节文件需从第1章起连续，遇到缺失的章节文件时从其前一章继续（之后的文件会被新生成的章节覆盖）。
+        """
+        folder_path = Path(__file__).parent.parent / "Resource" / "memory" / "story_plan"
+        try:
+            last_plan, max_chapter = read_max_index_file(str(folder_path))
+        except FileNotFoundError:
+            last_plan, max_chapter = None, 0
+
+        chapter_files = {}
+        for chapter in range(1, max_chapter + 1):
+            chapter_file = folder_path / f"chapter_{chapter}.json"
+            if not chapter_file.exists():
+                logging.warning(f"缺少章节文件 {chapter_file}，将从第 {chapter} 章继续生成")
+                break
+            chapter_files[chapter] = str(chapter_file)
+
+        last_chapter = max(chapter_files, default=0)
+        if last_chapter == 0:
+            last_plan = None
+        elif last_chapter != max_chapter:
+            last_plan = read_json(chapter_files[last_chapter])
+
+        reingested = self.memory_agent.resume_chapters(str(init_file), chapter_files)
+
+        self.current_chapter = last_chapter
+        self.last_plan = last_plan
+        logging.info(f"断点续跑：已有 {last_chapter} 章，重新导入 {len(reingested)} 章，从第 {last_chapter + 1} 章继续生成")
+
     def _load_initial_data(self, file_path: str) -> dict:
         """
         加载初始数据文件
@@ -234,19 +280,15 @@ class StoryGenWorkflow:
             short_goal (str): 当前章节的短期目标
             
         Returns:
-            str: 格式化后的角色提示词字符串，包含角色背景、目标和生成要求
-        """
-
-        template_str = json.dumps(story_plan_template, ensure_ascii=False, indent=2)
-        example_str = json.dumps(story_plan_example, ensure_ascii=False, indent=2)
+            str: 格式化后的角色提示词字符串，包含生成要求（静态前缀）以及角色背景和目标
 
-        role_prompt = ROLE_PROMPT_TEMPLATE.format(
+        模板结构、示例和生成要求已预先渲染为 ROLE_PROMPT.static_prefix，这里只填充角色相关的动态字段。
+        """
+        role_prompt = ROLE_PROMPT.render(
             role_identity=role_identity,
             role_relation=role_relation,
             role_events=role_events,
-            short_goal=short_goal,
-            template_str=template_str,
-            example_str=example_str
+            short_goal=short_goal
         )
         return role_prompt
 
@@ -301,6 +343,15 @@ class StoryGenWorkflow:
         # print(f"agent_config的类型:{type(self.agents_config)}")
         # print("agents_config ==============================\n")
         # agent_config存储的是角色信息
+        # 一次性取回上一章所有角色的记忆快照，后续各角色读取均命中 MemoryAgent 缓存
+        try:
+            self.memory_agent.get_character_memories(
+                [cfg["id"] for cfg in agents_config if cfg.get("id")],
+                max(0, self.current_chapter - 1)
+            )
+        except Exception as e:
+            logging.error(f"预取角色记忆失败: {str(e)}")
+
         # 2. 动态创建角色 agent
         role_agents = []
         for agent_config in agents_config:
@@ -389,6 +440,8 @@ class StoryGenWorkflow:
             self.memory_agent.save_character_memories(self.current_chapter)
             logging.info(f"角色记忆已保存")
 
+            return new_file_path
+
         except Exception as e:
             logging.error(f"保存章节失败: {str(e)}", exc_info=True)
             raise
@@ -411,14 +464,152 @@ class StoryGenWorkflow:
         else:
             return False
 
-    async def run(self):
+    async def _generate_short_goal(self, shortgoal_prompt, chapter_num, index, semaphore):
+        """
+        使用独立的短期目标智能体生成一个候选短期目标
+
+        参数:
+            shortgoal_prompt (str): 短期目标生成提示
+            chapter_num (int): 当前章节编号
+            index (int): 候选序号
+            semaphore (asyncio.Semaphore): 并发限制
+
+        返回:
+            dict | None: 解析后的短期目标，解析失败时返回 None
+        """
+        async with semaphore:
+            # 每个候选使用独立的智能体实例，互不共享上下文，因此无需清除记忆
+            agent = create_shortgoal_agent(self.model_client, name=f"shortgoal_agent_{index}")
+            response = await agent.run(task=shortgoal_prompt)
+
+        # 需从 autogen 的输出中剥离 shortgoal，并且要去掉 Markdown 语法
+        short_goal = strip_markdown_codeblock(extract_llm_content(response))
+        print(f"短期目标{index + 1}：\n{short_goal}")
+        try:
+            short_goal = json.loads(short_goal)  # 解析为JSON
+        except json.JSONDecodeError:
+            print(f"⚠️ 第 {index + 1} 个短期目标不是合法 JSON，已丢弃")
+            return None
+
+        # 补全章节标题与章节目标
+        short_goal["chapter_title"] = short_goal.get("chapter_title", f"第{chapter_num}章")
+        short_goal["chapter_goal"] = short_goal.get("chapter_goal", "")
+        print(f"短期目标{index + 1},优化后：\n{short_goal['chapter_goal']}")
+        return short_goal
+
+    async def _generate_short_goals(self, shortgoal_prompt, chapter_num):
+        """
+        并发生成 num_candidates 个候选短期目标
+
+        各候选相互独立，使用 asyncio.gather 同时等待，并通过信号量限制并发数。
+        单个候选失败不会影响其它候选。
+
+        返回:
+            list: 成功生成的短期目标列表（保持候选顺序）
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(
+            *(self._generate_short_goal(shortgoal_prompt, chapter_num, i, semaphore)
+              for i in range(self.num_candidates)),
+            return_exceptions=True
+        )
+
+        short_goals = []
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"⚠️ 第 {i + 1} 个短期目标生成失败: {str(result)}")
+            elif result is not None:
+                short_goals.append(result)
+        return short_goals
+
+    async def _generate_round_plan(self, short_goal_bp, chapter_num, index, semaphore):
+        """
+        为一个短期目标创建角色团队并生成对应的故事方案
+
+        参数:
+            short_goal_bp (dict): 短期目标
+            chapter_num (int): 当前章节编号
+            index (int): 方案序号
+            semaphore (asyncio.Semaphore): 并发限制
+
+        返回:
+            dict: 补全了 chapter_title 和 chapter_goal 的故事方案
+
+        异常:
+            asyncio.TimeoutError: 团队讨论超过 team_timeout 秒时抛出
+        """
+        async with semaphore:
+            print(f"\n🚀 开始第 {index + 1} 轮方案生成...")
+            # 创建角色团队（包含环境智能体和所有角色智能体）
+            team = self._create_team_from_config(short_goal_bp)
+
+            in_task = json.dumps({
+                    "instruction": "生成完整故事方案",
+                    "requirements": [
+                        f"故事所处背景: {self.background}\n"
+                        f"故事长期目标: {self.longgoal}\n"
+                        "保持角色性格一致性",
+                        "推进长期目标发展",
+                    ]
+
+                },
+                    ensure_ascii = False
+                )
+
+            # 运行团队讨论（明确指定任务格式），超过 team_timeout 秒则放弃该方案
+            response = await asyncio.wait_for(team.run(task=in_task), timeout=self.team_timeout)
+
+        # 输出响应内容（不尝试解析）
+        print(f"原始输出信息\n{response}")
+        # 提取LLM的回答
+        llm_content = extract_llm_content(response)
+        print(f"llm_content: \n{llm_content}")
+        final_content = self._process_llm_output(llm_content)
+        # 现在每一个短期目标的故事方案都已经生成，现在我们要在该字典中加上其对应的 chapter_title 和 chapter_goal
+        final_content["chapter_title"] = short_goal_bp.get("chapter_title", f"第{chapter_num}章")
+        final_content["chapter_goal"] = short_goal_bp.get("chapter_goal", "")
+        print(f"团队讨论结果\n{final_content}")
+        print(f"第 {index + 1} 轮方案生成完毕")
+        return final_content
+
+    async def _generate_round_plans(self, short_goals, chapter_num):
+        """
+        并发运行每个短期目标对应的角色团队
+
+        各团队拥有独立的智能体和任务，通过信号量限制并发数，并对每个团队单独设置超时。
+        某个团队失败或超时不会影响其它团队。
+
+        返回:
+            list: 成功生成的故事方案列表（保持短期目标顺序）
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(
+            *(self._generate_round_plan(short_goal_bp, chapter_num, i, semaphore)
+              for i, short_goal_bp in enumerate(short_goals)),
+            return_exceptions=True
+        )
+
+        round_plans = []
+        for i, result in enumerate(results):
+            if isinstance(result, asyncio.TimeoutError):
+                print(f"⚠️ 第 {i + 1} 轮生成超时（{self.team_timeout} 秒）")
+            elif isinstance(result, Exception):
+                print(f"⚠️ 第 {i + 1} 轮生成失败: {str(result)}")
+            else:
+                round_plans.append(result)
+        return round_plans
+
+    async def run(self, plan_queue: asyncio.Queue = None):
         """
         运行故事生成智能体工作流的主入口
         流程：
         1. 初始化智能体和数据
         2. 循环生成每个章节的内容
-        3. 每章生成三轮不同方案并进行评分
+        3. 每章并发生成 num_candidates 个不同方案并进行评分
         4. 检查是否达成长期目标，决定是否终止流程
+
+        :param plan_queue: 可选的章节方案队列。每章保存后将章节文件名放入队列，供写作工作流边生成边写作；
+                           队列设置了 maxsize 时，写作跟不上会在此处等待（背压）
         """
         # === 1. 初始化阶段 ===
         print("🚀 初始化智能体...")
@@ -446,9 +637,9 @@ class StoryGenWorkflow:
         while True:
             chapter_num = self._get_next_chapter_number()
             print(f"\n📖 开始生成第 {chapter_num} 章...")
-            round_plans = []  # 用来存放三个不同的短期目标对应的方案
+            round_plans = []  # 用来存放不同的短期目标对应的方案
             short_goal_backup = []
-            # 首先循环利用短期智能体生成三个短期目标，并且存入short_goal_backup[]，之后利用故事生成team循环生成三个对应的故事方案，并存入round_plans中。
+            # 首先并发利用短期智能体生成多个短期目标，并且存入short_goal_backup[]，之后并发运行故事生成team生成对应的故事方案，并存入round_plans中。
             # -- 2.1 生成短期目标 --
             try:
                 # 构造短期目标生成提示（包含长期目标和当前环境）
@@ -461,33 +652,8 @@ class StoryGenWorkflow:
 
                 print(f"短期目标生成提示：\n{shortgoal_prompt}")
 
-                # 这里要循环调用shortgoal_agent生成三个不同的短期目标
-                for i in range(0, 3):
-                    try:
-                        # 调用短期目标智能体（直接await异步调用）
-                        short_goal = await self.shortgoal_agent.run(
-                            task = shortgoal_prompt)  # 获取短期目标 智能体的system prompt 的变量是否正确获取？
-                        # 进行记忆的清除
-                        await self.shortgoal_agent.model_context.clear()
-                        # 需从 autogen 的输出中剥离 shortgoal，并且要去掉 Markdown 语法
-                        short_goal = strip_markdown_codeblock(extract_llm_content(short_goal))
-                        # 这里需要排查：1.是否提示词正常传入  A：提示词正常加载
-                        # 2.最终调用LLM的model_context是否存在重复内容  A：用户的task提示词拼接在系统提示词之后输入给LLM
-                        # 打印短期目标
-                        print(f"短期目标：\n{short_goal}")
-                        short_goal = json.loads(short_goal)  # 解析为JSON
-                        chapter_title = short_goal.get("chapter_title", f"第{chapter_num}章")
-                        chapter_goal = short_goal.get("chapter_goal", "")
-                        # 现在要加上之前制定的短期目标以及标题
-                        short_goal["chapter_title"] = chapter_title
-                        short_goal["chapter_goal"] = chapter_goal
-                        short_goal_backup.append(short_goal)  # 保存三个不同的短期目标
-
-                    except json.JSONDecodeError:
-                        chapter_title = f"第{chapter_num}章"
-                        chapter_goal = ""
-                    print(f"短期目标的类型: {type(chapter_goal)}")
-                    print(f"短期目标,优化后：\n{chapter_goal}")
+                # 并发生成 num_candidates 个不同的短期目标
+                short_goal_backup = await self._generate_short_goals(shortgoal_prompt, chapter_num)
             except Exception as e:
                 print(f"⚠️ 生成短期目标失败: {str(e)}")
                 continue  # 跳过本章节
@@ -495,59 +661,8 @@ class StoryGenWorkflow:
             print("\n ====================开始多轮方案生成 ========================  \n")
 
             # -- 2.2 多轮方案生成 --
-            round_plans = []
-            # 现在我要遍历short_backup，利用里面的三个不同的短期目标，循环生成三个不同的故事方案，并存入round_plans中，同时还要记录下序号。
-            counts = 0
-            for short_goal_bp in short_goal_backup:
-                print(f"\n🚀 开始第 {counts + 1} 轮方案生成...")
-                try:
-                    # 创建角色团队（包含环境智能体和所有角色智能体）
-                    team = self._create_team_from_config(short_goal_bp)
-
-                    """
-                    排查点：
-                    team的配置，智能体的数量和prompt是否正确
-                    """
-                    in_task = json.dumps({
-                            "instruction": "生成完整故事方案",
-                            "requirements": [
-                                f"故事所处背景: {self.background}\n"
-                                f"故事长期目标: {self.longgoal}\n"
-                                "保持角色性格一致性",
-                                "推进长期目标发展",
-                            ]
-
-                        },
-                            ensure_ascii = False
-                        )
-
-                    # 运行团队讨论（明确指定任务格式）
-                    response = await team.run(
-                        task=in_task
-                    )
-
-                    # 输出响应内容（不尝试解析）
-                    print(f"原始输出信息\n{response}")
-                    # 提取LLM的回答
-                    llm_content = extract_llm_content(response)
-                    """
-                    排查点：
-                    进行内容提取前后，llm_content的内容
-                    """
-                    print(f"llm_content: \n{llm_content}")
-                    final_content = self._process_llm_output(llm_content)
-                    # 现在每一个短期目标的故事方案都已经生成，现在我们要在该字典中加上其对应的 chapter_title 和 chapter_goal
-                    final_content["chapter_title"] = short_goal_bp.get("chapter_title", f"第{chapter_num}章")
-                    final_content["chapter_goal"] = short_goal_bp.get("chapter_goal", "")
-                    round_plans.append(final_content)
-                    print(f"团队讨论结果\n{final_content}")
-                    print(round_plans)
-                    print(f"第 {counts + 1} 轮方案生成完毕")
-                    counts += 1
-
-                except Exception as e:
-                    print(f"⚠️ 第 {counts + 1} 轮生成失败: {str(e)}")
-                    continue
+            # 每个短期目标对应一个独立的角色团队，并发运行并生成对应的故事方案
+            round_plans = await self._generate_round_plans(short_goal_backup, chapter_num)
 
             # -- 2.4 方案评估与保存 --
             if not round_plans:
@@ -559,7 +674,12 @@ class StoryGenWorkflow:
             try:
                 # 评分并选择最佳方案
                 print(f"🚀 评估中...")
-                best_plan, best_score = await evaluate_plan(round_plans, self.model_client)
+                best_plan, best_score = await evaluate_plan(
+                    round_plans,
+                    self.model_client,
+                    max_concurrency=self.max_concurrency,
+                    score_threshold=self.score_threshold
+                )
 
                 print(f"✅ 最佳方案评分: {best_score}")
                 print(f"✅ 最佳方案: {best_plan}")
@@ -577,10 +697,16 @@ class StoryGenWorkflow:
                 }
 
                 # 这个order_plan
-                # 保存章节数据 + 更新知识图谱
-                self._save_chapter(ordered_plan)
+                # 保存章节数据 + 更新知识图谱（写入在线程中执行，不阻塞事件循环）
+                saved_path = await asyncio.to_thread(self._save_chapter, ordered_plan)
                 self.last_plan = ordered_plan  # 保存当前章节作为下一章的"上一章"
 
+                # 通知写作工作流：本章方案已就绪
+                if plan_queue is not None:
+                    if plan_queue.full():
+                        print(f"⏳ 写作进度落后，等待方案队列空出（第{chapter_num}章）")
+                    await plan_queue.put(saved_path.name)
+
             except Exception as e:
                 print(f"⚠️ 方案保存失败: {str(e)}")
                 continue
@@ -0,0 +1,51 @@
+import asyncio
+
+from Workflow.StoryGen_wk import StoryGenWorkflow
+from Workflow.Writing_wk import WritingWorkflow
+
+
+class StoryPipelineWorkflow:
+    """
+    故事生成 + 写作的流式编排工作流
+
+    StoryGenWorkflow 每保存一章方案，就把章节文件名放入 asyncio 队列，
+    WritingWorkflow 从队列中读取并立即开始分析和写作。
+    第一章正文不必等整个故事规划完成，只需等到该章（及伏笔检索所需的后续 lookahead 章）的方案生成完毕。
+
+    背压：写作端处理槽位（chapters_in_flight）占满时停止读取队列，队列容量为 queue_maxsize，
+    队列满后方案生成会暂停等待；因此已生成未写完的章节最多约为
+    queue_maxsize + lookahead + chapters_in_flight 章。queue_maxsize 为 0 时不限制。
+    """
+
+    def __init__(self, model_client, article_type="novel", queue_maxsize=2, lookahead=2,
+                 storygen_kwargs=None, writing_kwargs=None):
+        """
+        :param model_client: 语言模型客户端
+        :param article_type: 文本类型（novel/script）
+        :param queue_maxsize: 方案队列容量（背压），0 表示不限制
+        :param lookahead: 写作第 N 章前需要等待的后续章节方案数，见 WritingWorkflow.run_from_queue
+        :param storygen_kwargs: 传给 StoryGenWorkflow 的其他参数
+        :param writing_kwargs: 传给 WritingWorkflow 的其他参数
+        """
+        self.article_type = article_type
+        self.queue_maxsize = max(0, int(queue_maxsize))
+        self.lookahead = max(0, int(lookahead))
+        # StoryGenWorkflow 初始化时会清空章节数据并加载第0章，因此先于写作工作流创建
+        self.storygen = StoryGenWorkflow(model_client, **(storygen_kwargs or {}))
+        self.writing = WritingWorkflow(model_client, **(writing_kwargs or {}))
+
+    async def _produce(self, plan_queue):
+        """运行故事生成，结束（或异常）时放入 None 通知写作端"""
+        try:
+            await self.storygen.run(plan_queue=plan_queue)
+        finally:
+            await plan_queue.put(None)
+
+    async def run(self):
+        """并发运行故事生成与写作"""
+        plan_queue = asyncio.Queue(maxsize=self.queue_maxsize)
+        await asyncio.gather(
+            self._produce(plan_queue),
+            self.writing.run_from_queue(plan_queue, self.article_type, self.lookahead)
+        )
+        print("🏁 故事生成与写作流程结束")
@@ -1,57 +1,56 @@
 import os
 import json
+import asyncio
+import hashlib
 from Resource.tools.strip_markdown_codeblock import strip_markdown_codeblock
-from Agent.WriteAgent import create_agents
+from Agent.WriteAgent import create_digger_agent, create_novel_writer, create_recall_agent, create_script_writer
 from Resource.tools.extract_llm_content import extract_llm_content
 from autogen_agentchat.agents import AssistantAgent
 from autogen_core.model_context import UnboundedChatCompletionContext
 from Agent.MemoryAgent import MemoryAgent
 from Resource.tools.read_json import read_json
+from Resource.template.write_prompt.novel_writer import novel_write_prompt_template
+from Resource.template.write_prompt.script_writer import script_write_prompt_template
+from Resource.template.write_prompt.recallagent import recall_prompt_template
+from Resource.template.write_prompt.digagent import dig_prompt_template
 
 import re
 
+# 构建清单格式版本，清单记录方式变化时递增
+MANIFEST_VERSION = 2
+
+# 各文本类型对应的写作提示词，参与章节输入哈希计算：提示词修改后所有章节都会重新生成
+WRITER_PROMPTS = {
+    "novel": novel_write_prompt_template,
+    "script": script_write_prompt_template,
+}
+
 class WritingWorkflow:
     """
     写作作文档工作流类，负责协调各智能体完成从章节分析到最终文本生成的全流程
     核心功能：处理章节JSON数据、调用智能体进行伏笔挖掘与回忆检索、整合数据并生成小说/剧本
     """
 
-    def __init__(self, model_client):
+    def __init__(self, model_client, max_concurrency=4, chapters_in_flight=3, skip_unchanged=True):
         """
         初始化工作流参数
         :param model_client: 语言模型客户端（如DeepSeek），用于智能体调用
+        :param max_concurrency: 同时进行的回忆分析 LLM 调用数上限
+        :param chapters_in_flight: 同时处理（分析+写作）的章节数上限，1 表示逐章顺序处理
+        :param skip_unchanged: 章节输入哈希与构建清单一致且输出文件存在时跳过该章
     """
         self.model_client = model_client 
+        self.max_concurrency = max_concurrency
+        self.chapters_in_flight = max(1, int(chapters_in_flight))
+        self.skip_unchanged = skip_unchanged
         self.chapters_dir = os.path.join("Resource", "memory", "story_plan")
         self.save_dir = os.path.join("Resource", "story")
+        self.manifest_path = os.path.join(self.save_dir, "build_manifest.json")
+        self._manifest = None
         self.current_chapter = 0
         self.chapter_count = 0
         self.memory_agent = MemoryAgent()
 
-        # 智能体初始化标记
-        self.agents_initialized = False
-
-    def _create_agents(self):
-        """
-        创建并初始化所有需要的智能体
-        智能体列表：
-        - memAgent: 内存管理智能体
-        - diggerAgent: 伏笔挖掘智能体
-        - recallAgent: 回忆检索智能体
-        - novel_writer: 小说写作智能体
-        - script_writer: 剧本写作智能体
-        """
-        if self.agents_initialized:
-            return  # 避免重复初始化
-
-        agents = create_agents(self.model_client)
-        self.diggerAgent = agents["diggerAgent"]
-        self.recallAgent = agents["recallAgent"]
-        self.novel_writer = agents["novel_writer"]
-        self.script_writer = agents["script_writer"]
-        self.agents_initialized = True
-        print("✅ 所有智能体初始化完成")
-
     def _validate_article_type(self, article_type):
         """
         验证写作类型合法性
@@ -77,72 +76,94 @@ class WritingWorkflow:
 
         return data
 
-    async def _need_recall_and_load(self, current_data):
+    async def _need_recall_and_load(self, current_data, events_by_character=None):
+        """
+        分人物回忆检索：各人物的回忆分析并发执行（并发数受 max_concurrency 限制），
+        每个人物使用独立的回忆Agent实例，互不共享上下文
+
+        :param events_by_character: 已查询好的各人物前序章节事件，为 None 时在此查询
+        """
         print("\n" + "=" * 50)
         print("🔍 开始分人物回忆检索流程")
 
         # 获取所有人物
         characters = current_data.get("characters", [])
-        all_recall_events = []
 
-        for character in characters:
-            char_id = character["id"]
-            print(f"\n👤 处理人物: {character.get('name')} ({char_id})")
+        if events_by_character is None:
+            events_by_character = await self._get_recall_candidates(current_data)
 
-            # 获取该人物在前序章节的事件
-            prev_events = self.memory_agent.get_previous_chapters_events(
-                character_id=char_id,
-                current_chapter=current_data["chapter"]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(
+            self._recall_for_character(
+                character, current_data, events_by_character.get(character["id"], []), index, semaphore
             )
-            print(f"prev_events: {prev_events}")
-            print(f"prev_events数量: {len(prev_events)}")
-
-            if not prev_events:
-                print(f"⚠️ 人物 {character.get('name')} 无前序章节事件")
-                continue
-
-            # 构建分人物输入数据
-            input_data = {
-                "current_character": character,
-                "current_events": [
-                    e for e in current_data.get("events", [])
-                    if char_id in e.get("participants", [])
-                ],
-                "past_events": prev_events
-            }
-            print(f"input_data: {input_data}")
-
-            # 调用回忆Agent
-            recall_result = await self.recallAgent.a_run(task=input_data)
-            # 清空 recallAgent 的上下文
-            await self.recallAgent.model_context.clear()
+            for index, character in enumerate(characters)
+        ))
+
+        # 按人物顺序汇总回忆事件
+        all_recall_events = [event for events in results for event in events]
+        return {"need_recall": "Yes" if all_recall_events else "No"}, all_recall_events
+
+    async def _recall_for_character(self, character, current_data, prev_events, index, semaphore):
+        """
+        为单个人物做回忆分析
+
+        :return: 该人物需要添加的回忆事件列表
+        """
+        char_id = character["id"]
+        print(f"\n👤 处理人物: {character.get('name')} ({char_id})")
+        print(f"prev_events: {prev_events}")
+        print(f"prev_events数量: {len(prev_events)}")
+
+        if not prev_events:
+            print(f"⚠️ 人物 {character.get('name')} 无前序章节事件")
+            return []
+
+        # 构建分人物输入数据
+        input_data = {
+            "current_character": character,
+            "current_events": [
+                e for e in current_data.get("events", [])
+                if char_id in e.get("participants", [])
+            ],
+            "past_events": prev_events
+        }
+        print(f"input_data: {input_data}")
+
+        recall_events = []
+        try:
+            # 调用回忆Agent（每个人物一个新实例，无需清空上下文）
+            recall_agent = create_recall_agent(self.model_client, name=f"recallAgent_{index}")
+            async with semaphore:
+                recall_result = await recall_agent.a_run(task=input_data)
             raw_output = extract_llm_content(recall_result)
             print(f"raw_output: {raw_output}")
 
-            try:
-                recall_resp = json.loads(strip_markdown_codeblock(raw_output))
-                if recall_resp.get("need_recall") == "Yes":
-                    print(f"✅ 需要为 {character.get('name')} 添加回忆:")
-                    for pos in recall_resp.get("positions", []):
-                        event_details = self.memory_agent.get_event_details(pos["id"])
-                        if event_details:
-                            event_details["related_character"] = char_id
-                            event_details["recall_reason"] = pos["reason"]
-                            all_recall_events.append(event_details)
-            except Exception as e:
-                print(f"❌ 处理人物 {character.get('name')} 回忆失败: {str(e)}")
+            recall_resp = json.loads(strip_markdown_codeblock(raw_output))
+            if recall_resp.get("need_recall") == "Yes":
+                print(f"✅ 需要为 {character.get('name')} 添加回忆:")
+                for pos in recall_resp.get("positions", []):
+                    event_details = await self.memory_agent.a_get_event_details(pos["id"])
+                    if event_details:
+                        event_details["related_character"] = char_id
+                        event_details["recall_reason"] = pos["reason"]
+                        recall_events.append(event_details)
+        except Exception as e:
+            print(f"❌ 处理人物 {character.get('name')} 回忆失败: {str(e)}")
 
-        return {"need_recall": "Yes" if all_recall_events else "No"}, all_recall_events
+        return recall_events
+
+    async def _need_dig_and_load(self, current_data, next_events=None):
+        """
+        伏笔事件检索
 
-    async def _need_dig_and_load(self, current_data):
+        :param next_events: 已查询好的后续章节事件，为 None 时在此查询
+        """
         print("\n" + "=" * 50)
         print("🔮 开始伏笔事件检索流程")
 
-        # 获取所有后续章节事件（不限定人物）
-        next_events = self.memory_agent.get_next_chapters_events(
-            current_chapter=current_data["chapter"],
-            end_chapter=self.chapter_count  # 查看后续5章
-        )
+        if next_events is None:
+            next_events = await self._get_dig_candidates(current_data)
         print("next_events:", next_events)
 
         if not next_events:
@@ -155,10 +176,9 @@ class WritingWorkflow:
             "future_events": next_events
         }
 
-        # 调用伏笔Agent
-        dig_result = await self.diggerAgent.a_run(task=input_data)
-        # 清空 diggerAgent 上下文
-        await self.diggerAgent.model_context.clear()
+        # 调用伏笔Agent（每章一个新实例，多章并行时互不干扰）
+        digger_agent = create_digger_agent(self.model_client, name=f"diggerAgent_{current_data['chapter']}")
+        dig_result = await digger_agent.a_run(task=input_data)
         raw_output = extract_llm_content(dig_result)
 
         try:
@@ -166,7 +186,7 @@ class WritingWorkflow:
             dig_events = []
             if dig_resp.get("need_dig") == "Yes":
                 for pos in dig_resp.get("positions", []):
-                    event_details = self.memory_agent.get_event_details(pos["id"])
+                    event_details = await self.memory_agent.a_get_event_details(pos["id"])
                     if event_details:
                         dig_events.append(event_details)
                         # 该函数返回的内容dig_resp是一个字典，包含是否需要挖掘伏笔的标志和具体位置，
@@ -180,6 +200,66 @@ class WritingWorkflow:
             print(f"❌ 伏笔分析失败: {str(e)}")
             return {"need_dig": "No"}, []
 
+    async def _get_dig_candidates(self, current_data):
+        """获取伏笔分析的候选事件：后续章节的事件（不限定人物）"""
+        return await self.memory_agent.a_get_next_chapters_events(
+            current_chapter=current_data["chapter"],
+            end_chapter=self.chapter_count  # 查看后续2章
+        )
+
+    async def _get_recall_candidates(self, current_data):
+        """获取回忆分析的候选事件：一次查询取回所有人物在前序章节的事件"""
+        return await self.memory_agent.a_get_characters_previous_events(
+            character_ids=[character["id"] for character in current_data.get("characters", [])],
+            current_chapter=current_data["chapter"]
+        )
+
+    def _chapter_input_hash(self, current_data, next_events, events_by_character, article_type):
+        """
+        计算章节写作输入的哈希
+
+        包括：本章方案、初始设定（第0章）、伏笔与回忆分析候选事件的ID（排序后）、分析与写作提示词。
+        候选事件来自相邻章节，因此相邻章节的事件增减后，依赖它的章节哈希也会变化。
+        """
+        payload = json.dumps({
+            "manifest_version": MANIFEST_VERSION,
+            "plan": current_data,
+            "init": self._load_current_chapter("chapter_0.json"),
+            "dig_event_ids": sorted(event["event_id"] for event in next_events or []),
+            "recall_event_ids": {
+                character_id: sorted(event["event_id"] for event in events)
+                for character_id, events in (events_by_character or {}).items()
+            },
+            "prompts": [WRITER_PROMPTS.get(article_type, ""), dig_prompt_template, recall_prompt_template],
+        }, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_manifest(self):
+        """读取构建清单：{"<章节>_<文本类型>": {"hash": 输入哈希, "output": 输出文件名}}"""
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._manifest = {}
+        return self._manifest
+
+    def _update_manifest(self, key, input_hash, filename):
+        """更新构建清单（先写临时文件再原子替换）"""
+        manifest = self._load_manifest()
+        manifest[key] = {"hash": input_hash, "output": filename}
+        os.makedirs(self.save_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _output_filename(chapter_num, article_type):
+        """章节输出文件名"""
+        ext = ".txt" if article_type == "novel" else ".md"
+        return f"chapter_{chapter_num}_{article_type}{ext}"
+
     async def _combine_plans(self, current_data, dig_events, recall_events):
         """
         完整整合当前章节数据与伏笔/回忆事件
@@ -266,18 +346,16 @@ class WritingWorkflow:
 
     async def _write_and_save(self, combined_data, chapter_num, article_type):
         
-        # 选择
-        writer = self.novel_writer if article_type == "novel" else self.script_writer
+        # 选择：每章使用新的写作智能体实例，多章并行写作时上下文互不干扰
+        create_writer = create_novel_writer if article_type == "novel" else create_script_writer
+        writer = create_writer(self.model_client, name=f"{article_type}_writer_{chapter_num}")
         print(f"✍️ 开始生成第{chapter_num}章 {article_type}...")
 
         try:
             # 根据文章体裁调用对应类别的写作智能体
 
             write_result = await writer.a_run(task=combined_data)
-            # 调用完成后要求清空该 agent 的上下文
             print("调用写作智能体结束")
-            await self.novel_writer.model_context.clear()
-            await self.script_writer.model_context.clear()
 
 
             # print(write_result.messages)
@@ -308,8 +386,7 @@ class WritingWorkflow:
                 )
 
             # 保存文件
-            ext = ".txt" if article_type == "novel" else ".md"
-            filename = f"chapter_{chapter_num}_{article_type}{ext}"
+            filename = self._output_filename(chapter_num, article_type)
             self._save_text(output_text, filename)
             print(f"📦 已保存至: {os.path.join(self.save_dir, filename)}")
 
@@ -358,22 +435,41 @@ class WritingWorkflow:
         current_data = self._load_current_chapter(chapter_file)  # 加载章节数据
         chapter_num = current_data.get("chapter", "unknown")  # 获取章节编号
 
-        # 2. 伏笔和回忆分析
-        dig_resp, dig_data = await self._need_dig_and_load(current_data)
-        # dig_resp和dig_data的
-        recall_resp, recall_data = await self._need_recall_and_load(current_data)
+        # 2. 查询伏笔/回忆候选事件，并与构建清单比对：输入未变化且输出已存在时跳过本章
+        next_events, events_by_character = await asyncio.gather(
+            self._get_dig_candidates(current_data),
+            self._get_recall_candidates(current_data)
+        )
+        manifest_key = f"{chapter_num}_{article_type}"
+        input_hash = self._chapter_input_hash(current_data, next_events, events_by_character, article_type)
+        entry = self._load_manifest().get(manifest_key)
+        if self.skip_unchanged and entry and entry.get("hash") == input_hash:
+            output_path = os.path.join(self.save_dir, entry["output"])
+            if os.path.exists(output_path):
+                print(f"⏭️ 第{chapter_num}章输入未变化，跳过写作: {output_path}")
+                with open(output_path, 'r', encoding='utf-8') as f:
+                    return f.read()
+
+        # 3. 伏笔和回忆分析（两者互不依赖，并发执行）
+        (dig_resp, dig_data), (recall_resp, recall_data) = await asyncio.gather(
+            self._need_dig_and_load(current_data, next_events),
+            self._need_recall_and_load(current_data, events_by_character)
+        )
         print(dig_resp)
         print(dig_data)
         print(recall_resp)
         print(recall_data)
 
-        # 3. 数据整合
+        # 4. 数据整合
         # 这里的_combine_plans函数会将当前章节数据与挖掘到的伏笔事件和回忆事件进行整合
         combined_data = await self._combine_plans(current_data, dig_data, recall_data)
         print(combined_data)
 
-        # 4. 写作并保存
-        return await self._write_and_save(combined_data, chapter_num, article_type)
+        # 5. 写作并保存，成功后记录到构建清单
+        output_text = await self._write_and_save(combined_data, chapter_num, article_type)
+        if output_text:
+            self._update_manifest(manifest_key, input_hash, self._output_filename(chapter_num, article_type))
+        return output_text
 
     async def run_all_chapters(self, article_type="novel"):
         """
@@ -396,12 +492,82 @@ class WritingWorkflow:
 
         self.chapter_count = len(all_files)
         print(f"📑 共发现 {len(all_files)} 个章节文件（跳过chapter_0.json），开始批量处理...")
+
+        # 各章写作只依赖本章方案和知识图谱，不依赖前一章的正文，因此按顺序启动、最多 chapters_in_flight 章同时处理：
+        # 第 N+1 章的伏笔/回忆分析与第 N 章的写作重叠进行，每章写入各自的输出文件
+        semaphore = asyncio.Semaphore(self.chapters_in_flight)
+
+        async def process(i, chapter_file):
+            async with semaphore:
+                self.current_chapter = max(self.current_chapter, i)
+                print(f"\n===== 处理第{i}/{len(all_files)}章: {chapter_file} =====")
+                return await self.run_single_chapter(chapter_file, article_type)
+
         # 现在开始处理每个章节，调用函数run_single_chapter进行处理
-        for i, chapter_file in enumerate(all_files, 1):
-            self.current_chapter = i
-            print(f"\n===== 处理第{i}/{len(all_files)}章: {chapter_file} =====")
-            await self.run_single_chapter(chapter_file, article_type)
+        results = await asyncio.gather(
+            *(process(i, chapter_file) for i, chapter_file in enumerate(all_files, 1)),
+            return_exceptions=True
+        )
+        for chapter_file, result in zip(all_files, results):
+            if isinstance(result, Exception):
+                print(f"⚠️ 章节 {chapter_file} 处理失败: {str(result)}")
+        return results
+
+
+    async def run_from_queue(self, plan_queue: asyncio.Queue, article_type="novel", lookahead=2):
+        """
+        流式写作：从队列中逐章读取已生成的章节方案文件名并写作，队列中的 None 表示方案生成结束
 
+        伏笔分析需要查看后续最多2章的事件，因此第 N 章在第 N+lookahead 章方案就绪（或生成结束）后才开始处理，
+        与批量模式得到相同的伏笔候选；lookahead=0 时收到方案立即写作。
+        最多 chapters_in_flight 章同时处理；处理槽位占满时暂停读取队列，使队列的 maxsize 对生成端形成背压。
+
+        :param plan_queue: 章节方案队列（元素为 story_plan 目录下的章节文件名）
+        :param article_type: 文本类型（novel/script）
+        :param lookahead: 开始写作前需要等待的后续章节数
+        """
+        article_type = self._validate_article_type(article_type)
+
+        semaphore = asyncio.Semaphore(self.chapters_in_flight)
+        pending = []  # 已收到、等待后续章节方案的章节文件
+        tasks = []
+
+        async def process(chapter_file):
+            # 处理槽位在读取队列前已获取，章节处理结束后释放
+            try:
+                print(f"\n===== 处理章节: {chapter_file} =====")
+                return await self.run_single_chapter(chapter_file, article_type)
+            finally:
+                semaphore.release()
+
+        while True:
+            # 本次读取会使一章开始处理时，先获取处理槽位：已有 chapters_in_flight 章在处理时不再读取队列，
+            # 队列填满后方案生成端的 put 会等待（背压）
+            slot_acquired = len(pending) >= lookahead
+            if slot_acquired:
+                await semaphore.acquire()
+            chapter_file = await plan_queue.get()
+            if chapter_file is None:
+                if slot_acquired:
+                    semaphore.release()
+                break
+            pending.append(chapter_file)
+            # 已生成方案的最大章节号，作为伏笔检索的章节上限
+            self.chapter_count = max(self.chapter_count, int(re.search(r'(\d+)', chapter_file).group(1)))
+            if len(pending) > lookahead:
+                tasks.append(asyncio.create_task(process(pending.pop(0))))
+
+        # 方案生成结束，处理剩余章节
+        for chapter_file in pending:
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(process(chapter_file)))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️ 章节处理失败: {str(result)}")
+
+        print("\n🎉 所有章节处理完成！")
+        return results
 
     async def run(self, article_type="novel"):
         """
@@ -411,12 +577,7 @@ class WritingWorkflow:
         # 1. 验证输入类型
         article_type = self._validate_article_type(article_type)
 
-        # 2. 初始化智能体
-        self._create_agents()
-        if self.novel_writer is None:
-            raise ValueError("小说写作智能体未正确初始化")
-
-        # 3. 处理所有章节
+        # 2. 处理所有章节（各章节的伏笔、回忆与写作智能体在处理时按需创建）
         await self.run_all_chapters(article_type)
 
         print("\n🎉 所有章节处理完成！")
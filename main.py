@@ -52,6 +52,10 @@ async def main():
     # # 运行故事生成工作流
     await storygenworkflow.run()
 
+    # 或者：边生成方案边写作（流式编排，替代上面的故事生成 + 下面的写作工作流）
+    # from Workflow.StoryPipeline_wk import StoryPipelineWorkflow
+    # await StoryPipelineWorkflow(model_client).run()
+
     # 运行写作工作流
     # await writingworkflow.run()
 
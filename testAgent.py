@@ -65,7 +65,7 @@ def test_memory_agent_with_files():
         try:
             # 保存到章节目录的同级目录
             save_path = chapters_dir.parent / "character"
-            agent.save_character_memories(1, str(save_path))
+            agent.save_character_memories(1, str(save_path), per_character_files=True)
             print(f"角色记忆已保存到: {save_path}")
 
             # 检查记忆文件是否生成
@@ -80,7 +80,7 @@ def test_memory_agent_with_files():
 
             # 保存到章节目录的同级目录
             save_path = chapters_dir.parent / "character"
-            agent.save_character_memories(2, str(save_path))
+            agent.save_character_memories(2, str(save_path), per_character_files=True)
             print(f"角色记忆已保存到: {save_path}")
 
             # 检查记忆文件是否生成